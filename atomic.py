@@ -0,0 +1,28 @@
+"""Atomic file writes shared by the result, cache, metrics and manifest writers"""
+import os
+import tempfile
+
+
+def _umask():
+    # The umask can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def atomic_write(path, text, prefix=".", suffix=".tmp"):
+    """Write ``text`` to ``path`` via a temporary file in the same directory and a rename.
+
+    Readers never see partial output. The file gets the permissions a plain
+    ``open`` would give it under the current umask, rather than mkstemp's 0600.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=prefix, suffix=suffix)
+    try:
+        os.fchmod(fd, 0o666 & ~_umask())
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,316 @@
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+import memory
+from process_pdf import BUFFER_TYPES, describe_info, extract_title_headings, print_status
+from sinks import FileSink
+
+
+# How often the parent checks busy workers' RSS against a memory ceiling
+MEMORY_POLL_SECONDS = 0.05
+
+
+def _worker_loop(conn, max_tasks, measure_peak=False):
+    """Serve extraction requests from the parent until recycled or told to stop"""
+    done = 0
+    while max_tasks <= 0 or done < max_tasks:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        source, options = task
+        info = {}
+        if measure_peak:
+            memory.reset_peak_rss()
+        try:
+            title, outline = extract_title_headings(source, info=info, **options)
+            if measure_peak:
+                info["peak_rss"] = memory.peak_rss_bytes() or memory.rss_bytes()
+            if info.get("error"):
+                conn.send(("error", info["error"], None, info))
+            else:
+                conn.send(("ok", title, outline, info))
+        except Exception as e:
+            conn.send(("error", str(e), None, info))
+        done += 1
+    conn.close()
+
+
+class _Worker:
+    """One worker process plus the key of the document it is currently handling"""
+
+    def __init__(self, ctx, max_tasks, measure_peak=False):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_loop, args=(child_conn, max_tasks, measure_peak), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.max_tasks = max_tasks
+        self.done = 0
+        self.key = None
+        self.started = None
+
+    def submit(self, key, source, options):
+        self.key = key
+        self.started = time.monotonic()
+        self.conn.send((source, options))
+
+    def finish(self):
+        key, elapsed = self.key, time.monotonic() - self.started
+        self.key = None
+        self.started = None
+        self.done += 1
+        return key, elapsed
+
+    @property
+    def busy(self):
+        return self.started is not None
+
+    @property
+    def exhausted(self):
+        return self.max_tasks > 0 and self.done >= self.max_tasks
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+def _sendable(source):
+    """A source that can be pickled to a worker process"""
+    if isinstance(source, BUFFER_TYPES) and not isinstance(source, bytes):
+        return bytes(source)
+    return source
+
+
+def _result(key, status, title, outline, error, elapsed, info=None):
+    return {"key": key, "status": status, "title": title, "outline": outline, "error": error,
+            "elapsed": elapsed, "info": info or {}}
+
+
+def extract_many(sources, workers=1, timeout=0, max_tasks_per_worker=50, options=None, stats=None,
+                 max_memory_mb=0):
+    """Extract many PDFs, yielding one result dict per source as each completes.
+
+    ``sources`` may be any iterable of paths or in-memory buffers (see
+    process_pdf.BUFFER_TYPES), or of ``(key, source)`` pairs; a bare source is
+    its own key. It is consumed lazily, so at most ``workers`` sources are in
+    flight at once. Each result holds the ``key``, ``status`` ("ok", "error",
+    "timeout", "memory" or "crashed"; extraction failures that extract_title_headings
+    reports through ``info["error"]`` count as "error"), ``title``, ``outline``, ``error``, ``elapsed``
+    seconds and the extraction ``info``.
+
+    With ``workers`` set to 1 documents are processed in the calling process,
+    which opens buffers without copying; 0 uses every CPU. Worker processes
+    receive buffers other than bytes as copies. A document that runs longer than
+    ``timeout`` seconds has its worker killed and replaced; workers are also
+    replaced after ``max_tasks_per_worker`` documents to bound PyMuPDF memory
+    growth, counted in ``stats["recycled"]`` if given. ``options`` are passed
+    to extract_title_headings as keywords.
+
+    ``max_memory_mb`` caps each worker's RSS while it handles a document. A
+    worker seen above it is killed, and one whose peak went above it is
+    replaced; either way the document gets status "memory" and
+    ``info["peak_rss"]``. A ceiling, like a ``timeout``, always runs documents
+    in worker processes, even with ``workers`` set to 1, since only a separate
+    process can be killed.
+    """
+    options = options or {}
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    pending = iter(sources)
+    if stats is not None:
+        stats.setdefault("recycled", 0)
+
+    def next_source():
+        for item in pending:
+            return item if isinstance(item, tuple) else (item, item)
+        return None
+
+    if workers == 1 and not timeout and not max_memory_mb:
+        while True:
+            item = next_source()
+            if item is None:
+                return
+            key, source = item
+            started = time.monotonic()
+            info = {}
+            try:
+                title, outline = extract_title_headings(source, info=info, **options)
+            except Exception as e:
+                yield _result(key, "error", "", [], str(e), time.monotonic() - started, info)
+                continue
+            if info.get("error"):
+                yield _result(key, "error", "", [], info["error"], time.monotonic() - started, info)
+                continue
+            yield _result(key, "ok", title, outline, None, time.monotonic() - started, info)
+
+    ctx = multiprocessing.get_context()
+    pool = []
+    exhausted = False
+    memory_limit = int(max_memory_mb * memory.MB)
+
+    def new_worker():
+        return _Worker(ctx, max_tasks_per_worker, measure_peak=bool(memory_limit))
+
+    def replace(index, kill=False):
+        pool[index].stop(kill=kill)
+        pool[index] = new_worker()
+
+    def memory_error(peak):
+        return f"exceeded {max_memory_mb:g} MB memory limit ({peak / memory.MB:.0f} MB resident)"
+
+    try:
+        while True:
+            # Workers start on demand, so short inputs never spawn the full pool
+            idle = [w for w in pool if not w.busy]
+            while not exhausted and (idle or len(pool) < workers):
+                item = next_source()
+                if item is None:
+                    exhausted = True
+                    break
+                if not idle:
+                    pool.append(new_worker())
+                    idle.append(pool[-1])
+                key, source = item
+                idle.pop().submit(key, _sendable(source), options)
+
+            busy = [w for w in pool if w.busy]
+            if not busy:
+                break
+
+            wait_for = None
+            if timeout > 0:
+                now = time.monotonic()
+                wait_for = max(0, min(w.started + timeout - now for w in busy))
+            if memory_limit:
+                wait_for = MEMORY_POLL_SECONDS if wait_for is None else min(wait_for, MEMORY_POLL_SECONDS)
+            ready = wait([w.conn for w in busy], timeout=wait_for)
+
+            for index, worker in enumerate(pool):
+                if not worker.busy:
+                    continue
+                if worker.conn in ready:
+                    try:
+                        status, title, outline, info = worker.conn.recv()
+                    except (EOFError, OSError):
+                        key, elapsed = worker.finish()
+                        replace(index, kill=True)
+                        yield _result(key, "crashed", "", [], "worker process exited unexpectedly", elapsed)
+                        continue
+                    key, elapsed = worker.finish()
+                    peak = info.get("peak_rss") or 0
+                    if memory_limit and peak > memory_limit:
+                        # A worker that grew past the ceiling rarely gives the memory back
+                        replace(index)
+                        yield _result(key, "memory", "", [], memory_error(peak), elapsed, info)
+                        continue
+                    if worker.exhausted:
+                        if stats is not None:
+                            stats["recycled"] += 1
+                        replace(index)
+                    if status == "ok":
+                        yield _result(key, "ok", title, outline, None, elapsed, info)
+                    else:
+                        yield _result(key, "error", "", [], title, elapsed, info)
+                elif timeout > 0 and time.monotonic() - worker.started >= timeout:
+                    key, elapsed = worker.finish()
+                    replace(index, kill=True)
+                    yield _result(key, "timeout", "", [], f"exceeded {timeout:g}s timeout", elapsed)
+                elif memory_limit:
+                    rss = memory.rss_bytes(worker.process.pid) or 0
+                    if rss > memory_limit:
+                        key, elapsed = worker.finish()
+                        replace(index, kill=True)
+                        yield _result(key, "memory", "", [], memory_error(rss), elapsed, {"peak_rss": rss})
+    finally:
+        for worker in pool:
+            worker.stop(kill=worker.busy)
+
+
+def result_record(pdf_path, status, title, outline, error=None, elapsed=None, info=None, digest=None):
+    """Output record for one document (see sinks)"""
+    info = info or {}
+    record = {"file": os.path.basename(pdf_path), "path": pdf_path, "sha256": digest, "status": status,
+              "title": title, "outline": outline, "error": error, "elapsed": elapsed}
+    if info.get("metrics"):
+        record["stages"] = dict(info["metrics"]["stages"])
+        if info["metrics"].get("memory"):
+            record["memory"] = info["metrics"]["memory"]
+    if info.get("peak_rss") and "memory" not in record:
+        record["memory"] = {"rss_peak": info["peak_rss"]}
+    if info.get("source"):
+        record["source"] = info["source"]
+    if info.get("title_source"):
+        record["title_source"] = info["title_source"]
+    if info.get("truncated"):
+        record["truncated"] = info["truncated"]
+    return record
+
+
+def run_batch(pdf_paths, output_dir, workers=None, timeout=0, max_tasks_per_worker=50, on_result=None,
+              options=None, sink=None, digests=None, max_memory_mb=0, memory_report=0):
+    """Process PDFs with extract_many, writing each result as soon as it finishes.
+
+    ``workers`` defaults to one per CPU; 1 processes the files in-line. Results
+    go to ``sink`` (see sinks), by default one JSON file per PDF in
+    ``output_dir``; ``digests`` supplies known SHA-256 digests by path.
+    ``max_memory_mb`` is passed to extract_many. Returns a summary dict with
+    counts, failures and throughput, plus the ``memory_report`` documents with
+    the highest peak RSS under ``memory_top`` (see memory.TopDocuments).
+    """
+    workers = workers or os.cpu_count() or 1
+    sink = sink or FileSink(output_dir)
+    digests = digests or {}
+    summary = {"total": len(pdf_paths), "succeeded": 0, "failed": 0, "timed_out": 0,
+               "failures": [], "recycled": 0}
+    top = memory.TopDocuments(memory_report)
+    start = time.monotonic()
+
+    for result in extract_many(pdf_paths, workers, timeout, max_tasks_per_worker, options, summary,
+                               max_memory_mb):
+        pdf_path, status, info = result["key"], result["status"], result["info"]
+        filename = os.path.basename(pdf_path)
+        top.add(filename, info, status)
+        sink.write(result_record(pdf_path, status, result["title"], result["outline"], result["error"],
+                                 result["elapsed"], info, digests.get(pdf_path)))
+        if status == "ok":
+            summary["succeeded"] += 1
+            details = describe_info(info)
+            print_status(f"✅ Processed: {filename}{details}", f"[SUCCESS] Processed: {filename}{details}")
+        else:
+            error = result["error"]
+            summary["timed_out" if status == "timeout" else "failed"] += 1
+            summary["failures"].append({"file": filename, "status": status, "error": error})
+            print_status(f"❌ Error processing {filename}: {error}",
+                         f"[ERROR] Error processing {filename}: {error}")
+        if on_result is not None:
+            on_result(pdf_path, status, result["title"], result["outline"], result["elapsed"], info)
+
+    summary["elapsed"] = time.monotonic() - start
+    summary["docs_per_second"] = summary["total"] / summary["elapsed"] if summary["elapsed"] else 0.0
+    # Worker processes start on demand, so there are never more than PDFs
+    summary["workers"] = max(1, min(workers, len(pdf_paths)))
+    summary["memory_top"] = top.documents()
+    return summary
+
+
+def print_summary(summary):
+    """Print the end-of-run throughput and failure report"""
+    print(f"Processed {summary['total']} PDFs in {summary['elapsed']:.2f}s "
+          f"({summary['docs_per_second']:.1f} docs/s, {summary['workers']} workers, "
+          f"{summary['recycled']} recycled)")
+    print(f"Succeeded: {summary['succeeded']}  Failed: {summary['failed']}  Timed out: {summary['timed_out']}")
+    for failure in summary["failures"]:
+        print(f"  {failure['file']}: {failure['status']} ({failure['error']})")
@@ -0,0 +1,89 @@
+"""Microbenchmark: subsection suppression via the inverted word index vs a linear scan.
+
+Replays the heading pass's subsection check over every block of a
+heading-dense document, once with the original per-heading set comparison
+and once with process_pdf._MainHeadingIndex, and checks they agree.
+
+    python benchmarks/bench_subsection.py
+"""
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fitz  # noqa: E402
+
+import process_pdf  # noqa: E402
+from corpus import make_heading_dense  # noqa: E402
+
+
+def linear_scan(texts, mains_after):
+    """Original algorithm: compare each block against every main heading found so far"""
+    found_main_headings = []
+    decisions = []
+    for index, clean_text in enumerate(texts):
+        skip_as_subsection = False
+        for main_heading in found_main_headings:
+            main_words = set(main_heading.upper().split())
+            current_words = set(clean_text.upper().split())
+            if (len(main_words.intersection(current_words)) >= 1 and
+                clean_text.upper() != main_heading.upper() and
+                len(current_words) <= len(main_words) + 2):
+                skip_as_subsection = True
+                break
+        decisions.append(skip_as_subsection)
+        if not skip_as_subsection and index in mains_after:
+            found_main_headings.append(clean_text)
+    return decisions
+
+
+def indexed(texts, mains_after):
+    """Inverted-index algorithm used by the heading pass"""
+    main_index = process_pdf._MainHeadingIndex()
+    decisions = []
+    for index, clean_text in enumerate(texts):
+        clean_upper = clean_text.upper()
+        skip_as_subsection = main_index.suppresses(clean_upper, set(clean_upper.split()))
+        decisions.append(skip_as_subsection)
+        if not skip_as_subsection and index in mains_after:
+            main_index.add(clean_text)
+    return decisions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=120, help="Pages in the synthetic document (default: 120)")
+    parser.add_argument("--corpus-dir", default=os.path.join(BENCH_DIR, ".corpus"))
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.corpus_dir, exist_ok=True)
+    path = os.path.join(args.corpus_dir, f"heading_dense_{args.pages}p.pdf")
+    if not os.path.exists(path):
+        make_heading_dense(path, args.pages)
+
+    with fitz.open(path) as doc:
+        layout = process_pdf.build_layout(doc)
+    texts = [block["text"].strip() for page in layout for block in page["blocks"] if block["text"].strip()]
+    # Short all-caps blocks are the ones the heading pass records as main headings
+    mains_after = {i for i, text in enumerate(texts) if text.isupper() and len(text.split()) <= 5}
+
+    timings = {}
+    results = {}
+    for name, check in (("linear", linear_scan), ("indexed", indexed)):
+        started = time.perf_counter()
+        results[name] = check(texts, mains_after)
+        timings[name] = time.perf_counter() - started
+
+    assert results["linear"] == results["indexed"], "indexed subsection check disagrees with linear scan"
+    print(f"{len(texts)} blocks, {len(mains_after)} main-heading candidates")
+    print(f"linear : {timings['linear'] * 1000:9.1f} ms")
+    print(f"indexed: {timings['indexed'] * 1000:9.1f} ms  ({timings['linear'] / timings['indexed']:.0f}x faster)")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
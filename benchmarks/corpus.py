@@ -0,0 +1,189 @@
+"""Deterministic synthetic PDF corpus for benchmarking process_pdf.
+
+Every document is generated with PyMuPDF from a fixed seed, so the same
+corpus (and the same extraction output) is produced on every machine.
+"""
+import argparse
+import os
+import random
+
+import fitz
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud "
+         "exercitation ullamco laboris nisi aliquip ex ea commodo consequat").split()
+
+
+def _sentence(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def make_poster(path, seed=1):
+    """One-page flyer: large banner, many short lines, no structural headings"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 70), "COMMUNITY SPRING FAIR", fontsize=30, fontname="hebo")
+    y = 120
+    for _ in range(14):
+        page.insert_text((72, y), _sentence(rng, 5), fontsize=12)
+        y += 24
+    page.insert_text((72, y + 10), "HOPE TO SEE YOU THERE", fontsize=18, fontname="hebo")
+    page.insert_text((72, y + 50), "www.example.org", fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def make_brochure(path, pages=4, seed=6):
+    """Brochure whose first page is dominated by large embedded photos"""
+    rng = random.Random(seed)
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 1200, 900), False)
+    pixmap.set_rect(pixmap.irect, (90, 140, 190))
+    for x in range(0, 1200, 5):
+        for y in range(0, 900, 61):
+            pixmap.set_pixel(x, y, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    photo = pixmap.tobytes("png")
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 70), "Harbour Festival Programme", fontsize=26, fontname="hebo")
+    for slot in range(3):
+        page.insert_image(fitz.Rect(72, 110 + slot * 210, 540, 300 + slot * 210), stream=photo)
+    for page_num in range(1, pages):
+        page = doc.new_page()
+        page.insert_text((72, 80), f"{page_num}. {rng.choice(WORDS).title()} events", fontsize=16, fontname="hebo")
+        page.insert_image(fitz.Rect(72, 100, 540, 300), stream=photo)
+        for line in range(20):
+            page.insert_text((72, 330 + line * 18), _sentence(rng, 12), fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def make_form(path, fields=40, seed=2):
+    """Application form with many short numbered fields"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 60), "Leave form for staff", fontsize=18, fontname="hebo")
+    y = 100
+    for number in range(1, fields + 1):
+        if y > 760:
+            page = doc.new_page()
+            y = 60
+        page.insert_text((72, y), f"{number}. {rng.choice(WORDS).title()} of applicant", fontsize=10)
+        y += 28
+    doc.save(path)
+    doc.close()
+
+
+def make_rfp(path, pages=6, seed=3):
+    """Proposal whose first page repeats an overlapping, corrupted title line"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    page = doc.new_page()
+    for offset in range(3):
+        page.insert_text((72 + offset, 60 + offset),
+                         "RFP: Request for Proposal RFP: Request for Proposal RFP: Request", fontsize=24)
+    page.insert_text((72, 120), "To Present a Proposal for Developing", fontsize=22)
+    page.insert_text((72, 150), "the Business Plan for the Regional", fontsize=22)
+    page.insert_text((72, 180), "Digital Library", fontsize=22)
+    page.insert_text((72, 220), "March 21, 2003", fontsize=20)
+    for line in range(12):
+        page.insert_text((72, 300 + line * 20), _sentence(rng, 10), fontsize=10)
+    for number in range(1, pages):
+        page = doc.new_page()
+        page.insert_text((72, 80), f"{number}. {rng.choice(WORDS).title()} Summary", fontsize=16, fontname="hebo")
+        for line in range(30):
+            page.insert_text((72, 120 + line * 18), _sentence(rng, 12), fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def make_report(path, pages, seed=4):
+    """Multi-page report with numbered H1/H2 sections, all-caps H3 labels and body text"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 80), "Annual Technical Review", fontsize=26, fontname="hebo")
+    page.insert_text((72, 112), "of the Platform Architecture", fontsize=26, fontname="hebo")
+    page.insert_text((72, 200), _sentence(rng, 8), fontsize=10)
+    section = 0
+    for page_num in range(1, pages):
+        page = doc.new_page()
+        page.insert_text((72, 30), "Annual Technical Review", fontsize=8)
+        page.insert_text((300, 780), str(page_num + 1), fontsize=8)
+        y = 70
+        while y < 720:
+            roll = rng.random()
+            if roll < 0.08:
+                section += 1
+                page.insert_text((72, y), f"{section}. {rng.choice(WORDS).title()} {rng.choice(WORDS)}",
+                                 fontsize=16, fontname="hebo")
+                y += 26
+            elif roll < 0.16:
+                page.insert_text((72, y), f"{section}.{rng.randint(1, 9)} {rng.choice(WORDS).title()} details",
+                                 fontsize=12.5, fontname="hebo")
+                y += 20
+            elif roll < 0.21:
+                page.insert_text((72, y), _sentence(rng, 3).upper(), fontsize=11, fontname="hebo")
+                y += 18
+            else:
+                writer = fitz.TextWriter(page.rect)
+                writer.append((72, y), _sentence(rng, 14), fontsize=10)
+                writer.write_text(page)
+                y += 15
+    doc.save(path)
+    doc.close()
+
+
+def make_heading_dense(path, pages=60, seed=5):
+    """Report with hundreds of distinct all-caps section headers between short paragraphs"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 80), "Catalogue of Registered Components", fontsize=24, fontname="hebo")
+    page.insert_text((72, 200), _sentence(rng, 8), fontsize=10)
+    for _ in range(1, pages):
+        page = doc.new_page()
+        y = 70
+        while y < 720:
+            code = "".join(rng.choice("ABCDEFGHKMNPRSTWXZ") for _ in range(rng.randint(4, 8)))
+            page.insert_text((72, y), f"{code} {rng.choice(WORDS).upper()}", fontsize=10, fontname="hebo")
+            y += 16
+            for _ in range(2):
+                writer = fitz.TextWriter(page.rect)
+                writer.append((72, y), _sentence(rng, 14), fontsize=10)
+                writer.write_text(page)
+                y += 14
+            y += 6
+    doc.save(path)
+    doc.close()
+
+
+def build_corpus(corpus_dir, report_sizes=(10, 100, 1000)):
+    """Generate the benchmark corpus and return {name: path}; existing files are reused"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    builders = {
+        "poster_1p": make_poster,
+        "brochure_images": make_brochure,
+        "form_fields": make_form,
+        "rfp_overlap": make_rfp,
+        "heading_dense": make_heading_dense,
+    }
+    for pages in report_sizes:
+        builders[f"report_{pages}p"] = lambda path, pages=pages: make_report(path, pages)
+
+    paths = {}
+    for name, builder in builders.items():
+        path = os.path.join(corpus_dir, f"{name}.pdf")
+        if not os.path.exists(path):
+            builder(path)
+        paths[name] = path
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the synthetic benchmark corpus")
+    parser.add_argument("corpus_dir", help="Directory to write the PDFs into")
+    args = parser.parse_args()
+    for name, path in build_corpus(args.corpus_dir).items():
+        print(f"{name}: {path}")
@@ -0,0 +1,196 @@
+"""Benchmark extract_title_headings on the synthetic corpus.
+
+Times every document end to end and per stage, measures peak memory in a
+fresh interpreter per document, writes a machine-readable JSON report and
+optionally compares it against a saved baseline:
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.25
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fitz  # noqa: E402
+
+import process_pdf  # noqa: E402
+from corpus import build_corpus  # noqa: E402
+
+DEFAULT_CORPUS_DIR = os.path.join(BENCH_DIR, ".corpus")
+
+
+def timed_extract(pdf_path):
+    """Run one instrumented extraction, returning (result, {stage: seconds})"""
+    info = {}
+    result = process_pdf.extract_title_headings(pdf_path, info=info, instrument=True)
+    return result, dict(info["metrics"]["stages"])
+
+
+def _result_digest(result):
+    title, outline = result
+    payload = json.dumps({"title": title, "outline": outline}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _memory_probe(pdf_path, queue):
+    """Child process: peak traced Python heap and RSS growth for one extraction"""
+    import resource
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    process_pdf.extract_title_headings(pdf_path)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({"traced_peak_kib": traced_peak // 1024, "rss_growth_kib": max(0, peak_rss - baseline_rss)})
+
+
+def measure_memory(pdf_path):
+    """Measure memory in a freshly spawned interpreter so documents don't share peaks"""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_memory_probe, args=(pdf_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def bench_document(name, pdf_path, repeat):
+    """Benchmark one document: median/min wall time, per-stage medians and memory"""
+    totals = []
+    stage_runs = []
+    digest = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result, stages = timed_extract(pdf_path)
+        totals.append(time.perf_counter() - started)
+        stage_runs.append(stages)
+        digest = _result_digest(result)
+
+    with fitz.open(pdf_path) as doc:
+        pages = len(doc)
+    stage_names = sorted({name for stages in stage_runs for name in stages})
+    return {
+        "name": name,
+        "pages": pages,
+        "bytes": os.path.getsize(pdf_path),
+        "repeat": repeat,
+        "median_s": statistics.median(totals),
+        "min_s": min(totals),
+        "pages_per_s": pages / statistics.median(totals) if totals and statistics.median(totals) else 0.0,
+        "stages_s": {stage: statistics.median(run.get(stage, 0.0) for run in stage_runs) for stage in stage_names},
+        "outline_entries": len(result[1]),
+        "result_digest": digest,
+        **measure_memory(pdf_path),
+    }
+
+
+def run(corpus_dir, repeat, report_sizes):
+    paths = build_corpus(corpus_dir, report_sizes)
+    cases = []
+    for name, path in paths.items():
+        case = bench_document(name, path, repeat)
+        cases.append(case)
+        print(f"{name:>14}: {case['median_s'] * 1000:9.1f} ms  {case['pages']:5d} pages  "
+              f"{case['traced_peak_kib']:7d} KiB traced  {case['rss_growth_kib']:7d} KiB RSS",
+              file=sys.stderr)
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "pymupdf": fitz.VersionBind,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "algorithm_version": process_pdf.ALGORITHM_VERSION,
+        "cases": cases,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Return regression messages for cases slower or hungrier than baseline * (1 + threshold)"""
+    problems = []
+    previous = {case["name"]: case for case in baseline.get("cases", [])}
+    for case in report["cases"]:
+        base = previous.get(case["name"])
+        if base is None:
+            # Reported by unmatched_cases; there is nothing to compare against yet
+            continue
+        if base.get("result_digest") != case["result_digest"]:
+            problems.append(f"{case['name']}: output changed ({base.get('result_digest')} -> {case['result_digest']})")
+        # min_s is the least noisy timing on shared machines
+        for metric in ("min_s", "traced_peak_kib"):
+            old, new = base.get(metric), case[metric]
+            # Ignore noise on very small absolute values
+            floor = 0.01 if metric == "min_s" else 64
+            if old is not None and new > max(old * (1 + threshold), old + floor):
+                problems.append(f"{case['name']}: {metric} {old:.4g} -> {new:.4g} "
+                                f"(+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return problems
+
+
+def unmatched_cases(report, baseline):
+    """Names of report cases missing from the baseline, and of baseline cases no longer run"""
+    current = {case["name"] for case in report["cases"]}
+    previous = {case["name"] for case in baseline.get("cases", [])}
+    return sorted(current - previous), sorted(previous - current)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark extract_title_headings on a synthetic corpus")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR, help="Where the generated PDFs are kept")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per document (default: 3)")
+    parser.add_argument("--quick", action="store_true", help="Skip the 1000-page report")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    parser.add_argument("--baseline", help="Compare against this baseline report")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative slowdown / memory growth before failing (default: 0.25)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Also write the report as a new baseline")
+    args = parser.parse_args(argv)
+
+    report_sizes = (10, 100) if args.quick else (10, 100, 1000)
+    report = run(args.corpus_dir, args.repeat, report_sizes)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.threshold)
+        new, dropped = unmatched_cases(report, baseline)
+        for name in new:
+            print(f"NO BASELINE {name}: not compared; regenerate the baseline with --save-baseline",
+                  file=sys.stderr)
+        for name in dropped:
+            print(f"NOT RUN {name}: in the baseline but not in this run", file=sys.stderr)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+from atomic import atomic_write
+from process_pdf import ALGORITHM_VERSION
+
+HASH_CHUNK_SIZE = 1 << 20
+# Extraction info written out with a result, and so cached with it
+RESULT_INFO_KEYS = ("source", "title_source")
+
+
+def file_digest(pdf_path):
+    """SHA-256 of the file contents, read in fixed-size chunks"""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_REFERENCE = re.compile(r"(\d+) (\d+) R")
+_RESOURCE_ENTRY = re.compile(r"/([^\s/<>\[\]()]+)\s*(\d+) \d+ R")
+_CONTENT_NAME = re.compile(rb"/([^\s/<>\[\]()%{}]+)")
+# Annotation entries that point back into the page tree or at other annotations
+_ANNOT_LINK = re.compile(r"/(P|Parent|Popup|IRT)\s*\d+ \d+ R")
+# Stream dictionary entries that only describe the encoding, which a re-save may change
+_STREAM_ENCODING = re.compile(r"/(Length|Filter|DecodeParms)\s*(\d+|/\w+|\[[^\]]*\]|<<[^>]*>>)")
+
+
+def page_digest(doc, page_num, memo):
+    """SHA-256 of what text extraction reads from one page: geometry, content stream and resources.
+
+    Only the fonts and XObjects the content stream names are hashed, so pages
+    sharing a resource dictionary that a revision extended keep their digest.
+    Indirect objects are hashed by content rather than object number, so a page
+    shared by different files or revisions gets the same digest. ``memo`` keeps
+    object digests across the pages of one open document. Streams are hashed
+    decoded, whatever their compression; image data is skipped, since layouts
+    never contain images. Annotations are hashed with their appearance
+    streams, since text extraction also reads form fields and FreeText
+    annotations. Returns None for a page whose digest cannot cover its
+    annotations, which must not be cached.
+    """
+    page = doc[page_num]
+    # read_contents fails on pages without /Contents, such as blank pages
+    contents = page.read_contents() if page.get_contents() else b""
+    used = {name.decode("latin-1") for name in _CONTENT_NAME.findall(contents)}
+    digest = hashlib.sha256()
+    digest.update(repr((tuple(page.mediabox), tuple(page.cropbox), page.rotation)).encode("ascii"))
+    digest.update(contents)
+
+    owner = page.xref
+    # Resources may be inherited from the page tree
+    while doc.xref_get_key(owner, "Resources")[0] == "null":
+        kind, parent = doc.xref_get_key(owner, "Parent")
+        if kind != "xref":
+            break
+        owner = int(parent.split()[0])
+    for category in ("Font", "XObject"):
+        kind, value = doc.xref_get_key(owner, f"Resources/{category}")
+        if kind == "xref":
+            value = doc.xref_object(int(value.split()[0]), compressed=True)
+        entries = sorted((name, int(xref)) for name, xref in _RESOURCE_ENTRY.findall(value) if name in used)
+        for name, xref in entries:
+            digest.update(f"{category}/{name}:{_object_digest(doc, xref, memo)}".encode("utf-8"))
+
+    for xref, _, _ in page.annot_xrefs():
+        if xref <= 0:
+            return None
+        # Back-references would pull the whole page tree into the digest
+        source = _ANNOT_LINK.sub("", doc.xref_object(xref, compressed=True))
+        digest.update(f"Annot:{_resolve_references(doc, source, memo)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _resolve_references(doc, source, memo):
+    return _REFERENCE.sub(lambda match: _object_digest(doc, int(match.group(1)), memo), source)
+
+
+def _object_digest(doc, xref, memo):
+    if xref in memo:
+        return memo[xref]
+    # Placeholder for reference cycles while the object is being hashed
+    memo[xref] = "cycle"
+    source = doc.xref_object(xref, compressed=True)
+    is_stream = doc.xref_is_stream(xref)
+    if is_stream:
+        source = _STREAM_ENCODING.sub("", source)
+    digest = hashlib.sha256(_resolve_references(doc, source, memo).encode("utf-8"))
+    if is_stream and doc.xref_get_key(xref, "Subtype")[1] != "/Image":
+        digest.update(doc.xref_stream(xref))
+    memo[xref] = digest.hexdigest()
+    return memo[xref]
+
+
+def cache_key(digest, version=ALGORITHM_VERSION):
+    """Combine a content digest with the algorithm version stamp"""
+    return hashlib.sha256(f"{version}:{digest}".encode("ascii")).hexdigest()
+
+
+class ResultCache:
+    """On-disk (title, outline) cache keyed by PDF content and algorithm version.
+
+    Entries are small JSON files sharded by key prefix. A hit refreshes the
+    entry's mtime, so prune() drops entries unused for ``max_age`` seconds and
+    then the least recently used ones until the cache fits in ``max_bytes``.
+    With ``rebuild`` set, lookups always miss and fresh results overwrite the
+    stored ones. A ``variant`` (such as an outline mode) keeps results of
+    options that change the output apart from the default ones.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, max_age=30 * 24 * 3600, rebuild=False,
+                 variant=""):
+        self.cache_dir = cache_dir
+        self.version = f"{ALGORITHM_VERSION}+{variant}" if variant else ALGORITHM_VERSION
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.rebuild = rebuild
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, digest):
+        """Return the cached ``(title, outline, info)`` for a content digest, or None.
+
+        ``info`` holds the stored RESULT_INFO_KEYS of the extraction info.
+        """
+        entry = self._read_entry(digest)
+        if entry is None:
+            return None
+        return entry["title"], entry["outline"], {key: entry[key] for key in RESULT_INFO_KEYS if entry.get(key)}
+
+    def put(self, digest, title, outline, info=None):
+        """Store a result atomically so concurrent readers never see partial entries"""
+        entry = {"title": title, "outline": outline}
+        for key in RESULT_INFO_KEYS:
+            if (info or {}).get(key):
+                entry[key] = info[key]
+        self._write_entry(digest, entry)
+
+    def _read_entry(self, digest):
+        if self.rebuild:
+            self.misses += 1
+            return None
+        path = self._entry_path(cache_key(digest, self.version))
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if entry.get("version") != self.version:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def _write_entry(self, digest, entry):
+        path = self._entry_path(cache_key(digest, self.version))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"version": self.version, "digest": digest, "created": time.time(), **entry}
+        atomic_write(path, json.dumps(entry, ensure_ascii=False, separators=(",", ":")), prefix="tmp")
+        self.stores += 1
+
+    def prune(self):
+        """Evict expired entries, then least recently used ones until under max_bytes"""
+        now = time.time()
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(".tmp"):
+                    # Leftovers from interrupted writes; recent ones may still be in flight
+                    if now - st.st_mtime > 3600:
+                        self._remove(path)
+                    continue
+                if self.max_age and now - st.st_mtime > self.max_age:
+                    self._remove(path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes and total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+        return self.evicted
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            self.evicted += 1
+        except OSError:
+            pass
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evicted": self.evicted}
+
+
+class PageCache(ResultCache):
+    """On-disk cache of text-only page layouts keyed by page_digest.
+
+    Pages shared across documents, such as cover sheets, standard appendices
+    and the unchanged pages of a revised report, are parsed once. Eviction and
+    statistics work as in ResultCache.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, max_age=30 * 24 * 3600, rebuild=False):
+        super().__init__(cache_dir, max_bytes, max_age, rebuild, variant="page")
+
+    def get(self, digest):
+        """Return the cached page (see process_pdf._text_only_page) for a page digest, or None"""
+        entry = self._read_entry(digest)
+        return entry["page"] if entry is not None else None
+
+    def put(self, digest, page):
+        self._write_entry(digest, {"page": page})
@@ -0,0 +1,112 @@
+"""Batch aggregation and export of per-document extraction metrics"""
+import json
+import os
+from collections import Counter, defaultdict
+
+from atomic import atomic_write
+
+METRIC_PREFIX = "pdf_extract"
+
+
+class MetricsAggregator:
+    """Collects per-document metrics (see process_pdf.new_metrics) across a batch"""
+
+    def __init__(self):
+        self.documents = []
+        self.statuses = Counter()
+        self.paths = Counter()
+        self.title_branches = Counter()
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self.seconds = 0.0
+
+    def add(self, name, metrics=None, elapsed=None, status="ok"):
+        """Record one document; ``metrics`` may be None for cache hits and failures"""
+        self.statuses[status] += 1
+        if elapsed is not None:
+            self.seconds += elapsed
+        record = {"file": name, "status": status, "elapsed": elapsed}
+        if metrics:
+            record.update({
+                "path": metrics.get("path"),
+                "title_branch": metrics.get("title_branch"),
+                "stages": dict(metrics.get("stages", {})),
+                "counters": dict(metrics.get("counters", {})),
+                "rejected": dict(metrics.get("rejected", {})),
+            })
+            if metrics.get("memory"):
+                record["memory"] = metrics["memory"]
+            if metrics.get("error"):
+                record["error"] = metrics["error"]
+            self.paths[metrics.get("path") or "unknown"] += 1
+            if metrics.get("title_branch"):
+                self.title_branches[metrics["title_branch"]] += 1
+            for stage, seconds in metrics.get("stages", {}).items():
+                self.stages[stage] += seconds
+            for counter, value in metrics.get("counters", {}).items():
+                self.counters[counter] += value
+            for rule, value in metrics.get("rejected", {}).items():
+                self.rejected[rule] += value
+        elif status == "cached":
+            self.paths["cached"] += 1
+        self.documents.append(record)
+
+    def summary(self):
+        """Batch totals as a plain dict"""
+        return {
+            "documents": len(self.documents),
+            "statuses": dict(self.statuses),
+            "paths": dict(self.paths),
+            "title_branches": dict(self.title_branches),
+            "seconds": self.seconds,
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+            "rejected": dict(self.rejected),
+        }
+
+    def write_json(self, path):
+        """Write per-document records plus the batch summary"""
+        _atomic_write(path, json.dumps({"summary": self.summary(), "documents": self.documents},
+                                       indent=2, ensure_ascii=False) + "\n")
+
+    def write_prometheus(self, path, prefix=METRIC_PREFIX):
+        """Write the batch totals in Prometheus text format (for node_exporter's textfile collector)"""
+        _atomic_write(path, prometheus_text(self.summary(), prefix))
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(summary, prefix=METRIC_PREFIX):
+    """Render a batch summary as Prometheus exposition text"""
+    lines = []
+
+    def metric(name, help_text, samples, kind="counter"):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_label(val)}"' for key, val in labels.items())
+            lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+    metric("documents_total", "Documents processed, by status",
+           [({"status": status}, count) for status, count in sorted(summary["statuses"].items())])
+    metric("document_seconds_total", "Wall time spent on documents", [({}, summary["seconds"])])
+    metric("path_total", "Documents by extraction path (full, outline, poster, form, empty, cached, error)",
+           [({"path": path}, count) for path, count in sorted(summary["paths"].items())])
+    metric("title_branch_total", "Documents by title extraction branch",
+           [({"branch": branch}, count) for branch, count in sorted(summary["title_branches"].items())])
+    metric("stage_seconds_total", "Wall time per extraction stage",
+           [({"stage": stage}, seconds) for stage, seconds in sorted(summary["stages"].items())])
+    for counter, value in sorted(summary["counters"].items()):
+        metric(f"{counter}_total", f"Total {counter.replace('_', ' ')}", [({}, value)])
+    metric("blocks_rejected_total", "Blocks discarded by the heading pass, by filter rule",
+           [({"rule": rule}, count) for rule, count in sorted(summary["rejected"].items())])
+    return "\n".join(lines) + "\n"
+
+
+def _atomic_write(path, text):
+    """Write via a temporary file and rename so scrapers never see partial output"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    atomic_write(path, text, prefix=".metrics-")
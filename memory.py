@@ -0,0 +1,143 @@
+"""Memory accounting for extraction runs.
+
+Python allocations are measured with tracemalloc, and process memory through
+the resident set size (RSS), since tracemalloc does not see MuPDF's own C
+allocations. On Linux the kernel's peak RSS is reset at the start of each
+document and stage, so the peaks include short-lived allocations inside
+``get_text``; elsewhere they fall back to the RSS sampled at stage ends.
+"""
+import heapq
+import os
+import re
+import tracemalloc
+
+MB = 1024 * 1024
+_PEAK_RSS = re.compile(rb"VmHWM:\s+(\d+) kB")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes(pid="self"):
+    """Current resident set size of a process, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+    """This process's peak resident set size since the last reset_peak_rss, or None"""
+    try:
+        with open("/proc/self/status", "rb") as f:
+            match = _PEAK_RSS.search(f.read())
+    except OSError:
+        return None
+    return int(match.group(1)) * 1024 if match else None
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS to the current RSS; False where unsupported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class MemoryTrace:
+    """Per-stage and per-document memory figures for one extraction.
+
+    Stored in ``metrics["memory"]`` while the document runs, so that each
+    stage lap (see process_pdf._stage_timer) calls sample; finish replaces it
+    with a plain dict.
+    """
+
+    def __init__(self):
+        self.owns_tracing = not tracemalloc.is_tracing()
+        if self.owns_tracing:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+        self.traced_base = tracemalloc.get_traced_memory()[0]
+        self.kernel_peak = reset_peak_rss()
+        self.rss_start = rss_bytes()
+        self.traced_peak = 0
+        self.rss_peak = self.rss_start or 0
+        self.stages = {}
+
+    def _measure(self):
+        traced_peak = tracemalloc.get_traced_memory()[1] - self.traced_base
+        tracemalloc.reset_peak()
+        rss_peak = peak_rss_bytes() if self.kernel_peak else rss_bytes()
+        if self.kernel_peak:
+            reset_peak_rss()
+        traced_peak = max(0, traced_peak)
+        rss_peak = rss_peak or 0
+        self.traced_peak = max(self.traced_peak, traced_peak)
+        self.rss_peak = max(self.rss_peak, rss_peak)
+        return traced_peak, rss_peak
+
+    def sample(self, stage):
+        """Charge the peaks since the previous sample to ``stage``"""
+        traced_peak, rss_peak = self._measure()
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = {"traced_peak": traced_peak, "rss_peak": rss_peak}
+        else:
+            entry["traced_peak"] = max(entry["traced_peak"], traced_peak)
+            entry["rss_peak"] = max(entry["rss_peak"], rss_peak)
+
+    def finish(self):
+        """Stop tracing and return the document's figures in bytes"""
+        self._measure()
+        if self.owns_tracing:
+            tracemalloc.stop()
+        return {"traced_peak": self.traced_peak, "rss_start": self.rss_start, "rss_peak": self.rss_peak,
+                "rss_end": rss_bytes(), "stages": self.stages}
+
+
+def document_peak(info):
+    """Peak RSS recorded for one document, from its memory trace or its worker, or None"""
+    memory = (info.get("metrics") or {}).get("memory")
+    if memory:
+        return memory["rss_peak"]
+    return info.get("peak_rss")
+
+
+class TopDocuments:
+    """The ``n`` documents with the highest peak RSS seen so far"""
+
+    def __init__(self, n):
+        self.n = n
+        self._heap = []
+        self._seen = 0
+
+    def add(self, name, info, status="ok"):
+        peak = document_peak(info)
+        if peak is None or self.n <= 0:
+            return
+        memory = (info.get("metrics") or {}).get("memory") or {}
+        # The counter keeps ties from comparing the entry dicts
+        self._seen += 1
+        entry = (peak, self._seen, {"file": name, "status": status, "rss_peak": peak,
+                                    "traced_peak": memory.get("traced_peak")})
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, entry)
+        else:
+            heapq.heappushpop(self._heap, entry)
+
+    def documents(self):
+        """Entries, highest peak first"""
+        return [entry for _, _, entry in sorted(self._heap, key=lambda item: (-item[0], item[1]))]
+
+
+def print_report(documents):
+    """Print the top memory consumers"""
+    if not documents:
+        return
+    print(f"Top {len(documents)} documents by peak memory:")
+    for entry in documents:
+        traced = f", {entry['traced_peak'] / MB:.1f} MB Python" if entry["traced_peak"] is not None else ""
+        status = f" [{entry['status']}]" if entry["status"] != "ok" else ""
+        print(f"  {entry['file']}: {entry['rss_peak'] / MB:.1f} MB RSS{traced}{status}")
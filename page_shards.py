@@ -0,0 +1,175 @@
+"""Split one large PDF's pages across worker processes.
+
+Each shard worker opens the document itself and parses a contiguous page
+range once. It then answers two requests from the parent: partial font
+statistics and numbered-field counts, and, once the parent has fixed the body
+size and title, the shard's heading candidates (see
+process_pdf._page_candidates). The parent merges the histograms in page order
+and replays every candidate through process_pdf._accept_candidate in page
+order, so the heading state evolves exactly as in the sequential pass.
+"""
+import multiprocessing
+from collections import defaultdict
+
+import process_pdf
+
+SHARD_MIN_PAGES = 32
+
+
+def shard_ranges(page_count, shards):
+    """Contiguous (start, stop) page ranges, at most one per SHARD_MIN_PAGES pages"""
+    shards = max(1, min(shards, page_count // SHARD_MIN_PAGES))
+    return [(page_count * i // shards, page_count * (i + 1) // shards) for i in range(shards)]
+
+
+def _shard_worker(conn, source, start, stop):
+    """Parse one page range, then serve the statistics and candidate requests"""
+    try:
+        doc = process_pdf.open_document(source)
+        try:
+            layout = [process_pdf._page_layout(doc[page_num], page_num) for page_num in range(start, stop)]
+        finally:
+            doc.close()
+
+        font_stats = defaultdict(int)
+        numbered_fields = 0
+        blocks = 0
+        spans = 0
+        for page_layout in layout:
+            process_pdf._add_font_statistics(page_layout, font_stats)
+            numbered_fields += process_pdf._page_numbered_fields(page_layout)
+            blocks += len(page_layout["blocks"])
+            spans += sum(len(line["spans"]) for block in page_layout["blocks"] for line in block["lines"])
+        # Items keep first-seen order, which decides ties in the merged histogram
+        conn.send(("ok", {"font_stats": list(font_stats.items()), "numbered_fields": numbered_fields,
+                          "blocks": blocks, "spans": spans}))
+
+        request = conn.recv()
+        if request is None:
+            return
+        body_size, title, count_rejected, rule_set = request
+        rejected = defaultdict(int) if count_rejected else None
+        counters = defaultdict(int) if count_rejected else None
+        candidates = []
+        for page_layout in layout:
+            candidates.extend(process_pdf._page_candidates(page_layout, body_size, title, rejected=rejected,
+                                                           counters=counters, rule_set=rule_set))
+        conn.send(("ok", {"candidates": candidates, "rejected": dict(rejected or {}),
+                          "counters": dict(counters or {})}))
+    except EOFError:
+        pass
+    except Exception as e:
+        conn.send(("error", f"pages {start}-{stop - 1}: {e}"))
+    finally:
+        conn.close()
+
+
+def _receive(conn):
+    try:
+        status, payload = conn.recv()
+    except EOFError:
+        raise RuntimeError("shard worker exited unexpectedly")
+    if status != "ok":
+        raise RuntimeError(payload)
+    return payload
+
+
+def extract_sharded(source, doc, shards, info=None, metrics=None, rule_sets=None):
+    """Sharded equivalent of extract_title_headings' default path for an open ``doc``.
+
+    ``source`` is reopened in each worker, so it must be a path or a buffer;
+    buffers other than bytes are sent as a bytes copy, since an mmap cannot be
+    pickled to a spawned process.
+    Rule sets are sent to workers by name (see rules.RULE_SETS).
+    Returns ``(title, outline)`` identical to the single-process result.
+    """
+    lap = process_pdf._stage_timer(metrics)
+    page_count = len(doc)
+    ranges = shard_ranges(page_count, shards)
+    if isinstance(source, process_pdf.BUFFER_TYPES) and not isinstance(source, bytes):
+        source = bytes(source)
+    ctx = multiprocessing.get_context()
+    workers = []
+    try:
+        for start, stop in ranges:
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_shard_worker, args=(child_conn, source, start, stop), daemon=True)
+            process.start()
+            child_conn.close()
+            workers.append((process, conn))
+
+        # The parent reads page 0 itself for the title search
+        first_page = process_pdf._page_layout(doc[0], 0)
+        partials = [_receive(conn) for _, conn in workers]
+        lap("layout")
+
+        font_stats = defaultdict(int)
+        numbered_fields = 0
+        for partial in partials:
+            for size, count in partial["font_stats"]:
+                font_stats[size] += count
+            numbered_fields += partial["numbered_fields"]
+        if info is not None:
+            info["shards"] = len(ranges)
+        if metrics is not None:
+            counters = metrics["counters"]
+            counters["pages"] = page_count
+            counters["pages_parsed"] = page_count + 1
+            counters["blocks"] = sum(partial["blocks"] for partial in partials)
+            counters["spans"] = sum(partial["spans"] for partial in partials)
+
+        body_size = max(font_stats.items(), key=lambda x: x[1])[0] if font_stats else None
+        lap("font_stats")
+        if body_size is None:
+            if metrics is not None:
+                metrics["path"] = "empty"
+            return "", []
+        if info is not None:
+            info["body_size"] = {"method": "full", "value": body_size, "pages_read": page_count,
+                                 "sample_pages": 0, "page_count": page_count, "fallback": False}
+
+        title = process_pdf._extract_title(first_page, body_size, metrics)
+        lap("title")
+
+        rule_set = process_pdf._heading_rule_set(title, numbered_fields, rule_sets, metrics)
+        lap("classify")
+        if rule_set is None:
+            return title, []
+
+        rejected = metrics["rejected"] if metrics is not None else None
+        for _, conn in workers:
+            conn.send((body_size, title, rejected is not None, rule_set))
+        state = process_pdf._new_heading_state()
+        headings = []
+        for _, conn in workers:
+            partial = _receive(conn)
+            if rejected is not None:
+                for rule, count in partial["rejected"].items():
+                    rejected[rule] += count
+                for counter, count in partial["counters"].items():
+                    metrics["counters"][counter] += count
+            for candidate in partial["candidates"]:
+                heading = process_pdf._accept_candidate(candidate, state, rejected)
+                if heading is not None:
+                    headings.append(heading)
+
+        # Clean up duplicate title in headings
+        if headings and headings[0]["text"].strip() == title.strip():
+            headings = headings[1:]
+        lap("headings")
+        if metrics is not None:
+            metrics["path"] = "full"
+            metrics["counters"]["headings"] = len(headings)
+        return title, headings
+    finally:
+        for process, conn in workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for process, _ in workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+                process.join()
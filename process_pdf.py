@@ -1,531 +1,1804 @@
+import argparse
 import fitz
+import itertools
 import json
+import mmap
 import os
 import re
+import time
 from collections import defaultdict
+from math import sqrt
+from statistics import NormalDist
 
+import rules
+from atomic import atomic_write
+from rules import FORM_MIN_NUMBERED_FIELDS, HEADING_MAX_CHARS, HEADING_THRESHOLDS
 
-def extract_title_headings(pdf_path):
-    """Extract title and hierarchical headings from PDF using universal algorithms"""
-    try:
-        doc = fitz.open(pdf_path)
-        title = ""
-        headings = []
-        font_stats = defaultdict(int)
+# Bump whenever extraction logic changes so cached results are invalidated
+ALGORITHM_VERSION = "1"
 
-        # Single page poster detection
-        if len(doc) == 1:
-            page = doc[0]
-            blocks = page.get_text("dict", sort=True).get("blocks", [])
-            all_lines = []
-            for block in blocks:
-                for line in block.get("lines", []):
-                    line_text = ""
-                    for span in line.get("spans", []):
-                        line_text += span.get("text", "")
-                    clean_line = line_text.strip()
-                    if clean_line:
-                        all_lines.append(clean_line)
-            
-            if len(all_lines) > 10:
-                has_structural_headings = False
-                
-                for block in blocks:
-                    for line in block.get("lines", []):
-                        line_text = ""
-                        max_font_size = 0
-                        for span in line.get("spans", []):
-                            line_text += span.get("text", "")
-                            font_size = span.get("size", 0)
-                            if font_size > max_font_size:
-                                max_font_size = font_size
-                        
-                        clean_text = line_text.strip()
-                        if not clean_text:
-                            continue
-                        
-                        if (re.match(r'^\d+\.\s+', clean_text) or
-                            re.match(r'^\d+\.\d+\s+', clean_text) or
-                            (clean_text.endswith(':') and len(clean_text.split()) <= 4 and max_font_size > 14)):
-                            has_structural_headings = True
-                            break
-                    if has_structural_headings:
-                        break
-                
-                if not has_structural_headings and len(all_lines) >= 2:
-                    return "", [{
-                        "level": "H1",
-                        "text": all_lines[-2] + " ",
-                        "page": 0
-                    }]
-                elif not has_structural_headings:
-                    return "", []
+# Sampled body-size estimation (streaming mode only)
+SAMPLE_MIN_DOCUMENT_PAGES = 24
+SAMPLE_MIN_PAGES = 8
+SAMPLE_CHECK_EVERY = 4
+SAMPLE_MAX_FRACTION = 0.3
+# Pages behind the title's body size when a page limit cut the font statistics short
+TITLE_SAMPLE_PAGES = 8
 
-        # Analyze font statistics
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            blocks = page.get_text("dict", sort=True).get("blocks", [])
-            for block in blocks:
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        font_size = round(span.get("size", 0), 1)
-                        font_stats[font_size] += len(span.get("text", ""))
+OUTLINE_MODES = ("heuristic", "prefer-outline", "compare")
+OUTLINE_MIN_ENTRIES = 3
+OUTLINE_MAX_DEPTH = 6
 
-        if not font_stats:
-            return "", []
+# Text-only extraction: image blocks (and their decoded pixel payloads) are
+# never built, since no stage reads them
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
 
-        body_size = max(font_stats.items(), key=lambda x: x[1])[0]
+# In-memory inputs accepted wherever a PDF path is
+BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
 
-        # Extract title from first page
-        first_page = doc[0]
-        title_area = fitz.Rect(0, 0, first_page.rect.width, first_page.rect.height * 0.3)
-        title_candidates = []
+# What each pass needs from a page. Passes that depend on reading order
+# (title, poster, headings, first-seen font-size ties) get sorted blocks.
+PAGE_NEEDS = {
+    "layout": {"sort": True},
+    "numbered_fields": {"sort": False},
+}
 
-        blocks = first_page.get_text("dict", sort=True).get("blocks", [])
-        
-        # Detect overlapping/corrupted text patterns
-        has_overlapping_text = False
-        for block in blocks:
-            block_rect = fitz.Rect(block.get("bbox", (0, 0, 0, 0)))
-            if not block_rect.intersects(title_area):
+
+def open_document(source):
+    """Open a PDF from a filesystem path or an in-memory buffer (see BUFFER_TYPES).
+
+    bytes, and memoryviews spanning a whole bytes object, are opened without
+    copying; other buffers are copied only if PyMuPDF rejects them as a stream.
+    """
+    if isinstance(source, BUFFER_TYPES):
+        if isinstance(source, memoryview) and isinstance(source.obj, bytes) and source.nbytes == len(source.obj):
+            source = source.obj
+        try:
+            return fitz.open(stream=source, filetype="pdf")
+        except TypeError:
+            return fitz.open(stream=bytes(source), filetype="pdf")
+    return fitz.open(source)
+
+
+def _source_name(source):
+    """Display name for error messages"""
+    if isinstance(source, BUFFER_TYPES):
+        return "<memory>"
+    return os.path.basename(source)
+
+
+def build_layout(doc, budget=None, read_page=None):
+    """Parse every page once into a reusable layout model.
+
+    With a ``budget`` (see Budget), parsing stops early and the layout holds
+    only the pages read so far. ``read_page`` (see _page_reader) replaces the
+    direct page parse.
+    """
+    read_page = read_page or (lambda n: _page_layout(doc[n], n))
+    if budget is None:
+        return [read_page(page_num) for page_num in range(len(doc))]
+    layout = []
+    for page_num in range(len(doc)):
+        page_layout = budget.read(read_page, page_num, len(doc))
+        if page_layout is None:
+            break
+        layout.append(page_layout)
+    return layout
+
+
+class Budget:
+    """Deadline (seconds from now) and page limit for one extraction call.
+
+    Page 0 is always read, and the title's body size comes from a small sample
+    that ignores the page limit (see _title_body_size). Once the budget
+    runs out, or a later page fails to parse, ``truncated`` records why and
+    the last page read.
+    """
+
+    def __init__(self, deadline=None, max_pages=None):
+        self.expires = time.monotonic() + deadline if deadline else None
+        self.max_pages = max_pages or None
+        self.truncated = None
+        self._cap = None
+
+    def share(self, fraction):
+        """A budget for an earlier pass that may spend ``fraction`` of the remaining time"""
+        part = Budget(max_pages=self.max_pages)
+        if self.expires is not None:
+            now = time.monotonic()
+            part.expires = now + max(0.0, self.expires - now) * fraction
+        return part
+
+    def cap(self, truncated):
+        """Stop where an earlier pass over the same pages was truncated, for the same reason"""
+        self.max_pages = truncated["last_page"] + 1
+        self._cap = truncated
+
+    @property
+    def active(self):
+        return self.expires is not None or self.max_pages is not None
+
+    @property
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def read(self, parse, page_num, page_count):
+        """Return ``parse(page_num)``, or None once the budget is spent"""
+        if page_num:
+            if self.max_pages is not None and page_num >= self.max_pages:
+                if self._cap is not None:
+                    self.truncated = dict(self._cap)
+                    return None
+                return self._truncate(page_num, page_count, "max_pages")
+            if self.expired:
+                return self._truncate(page_num, page_count, "deadline")
+        try:
+            return parse(page_num)
+        except Exception as e:
+            if not self.active or not page_num:
+                raise
+            return self._truncate(page_num, page_count, "error", str(e))
+
+    def _truncate(self, page_num, page_count, reason, error=None):
+        self.truncated = {"reason": reason, "last_page": page_num - 1, "page_count": page_count}
+        if error:
+            self.truncated["error"] = error
+        return None
+
+
+def text_blocks(page, need="layout"):
+    """Text-only dict blocks of a page, extracted as the ``need`` in PAGE_NEEDS asks"""
+    return page.get_text("dict", flags=TEXT_FLAGS, sort=PAGE_NEEDS[need]["sort"]).get("blocks", [])
+
+
+def _page_layout(page, page_num, need="layout"):
+    """Flatten one page's text dict into blocks, lines and spans"""
+    blocks = []
+    for block in text_blocks(page, need):
+        lines = []
+        block_text = ""
+        block_max_size = 0
+        block_bold = False
+        for line in block.get("lines", []):
+            spans = []
+            line_text = ""
+            line_max_size = 0
+            for span in line.get("spans", []):
+                text = span.get("text", "")
+                size = span.get("size", 0)
+                font = span.get("font", "")
+                bold = "bold" in font.lower()
+                spans.append({
+                    "text": text,
+                    "size": size,
+                    "font": font,
+                    "bold": bold,
+                    "bbox": span.get("bbox", (0, 0, 0, 0)),
+                })
+                line_text += text
+                if size > line_max_size:
+                    line_max_size = size
+                if bold:
+                    block_bold = True
+            lines.append({"text": line_text, "max_size": line_max_size, "spans": spans})
+            block_text += line_text
+            if line_max_size > block_max_size:
+                block_max_size = line_max_size
+        blocks.append({
+            "bbox": tuple(block.get("bbox", (0, 0, 0, 0))),
+            "lines": lines,
+            "text": block_text,
+            "max_size": block_max_size,
+            "is_bold": block_bold,
+        })
+    return {
+        "page_num": page_num,
+        "width": page.rect.width,
+        "height": page.rect.height,
+        "blocks": blocks,
+        "summary": _page_summary(blocks),
+    }
+
+
+def _page_reader(doc, page_cache=None, info=None):
+    """``read_page(page_num, need)`` for ``doc``, going through ``page_cache`` (see cache.PageCache) if given.
+
+    Page 0 is always parsed in full, since the title and poster checks read its
+    spans; other pages come back text-only (see _text_only_page) when cached.
+    Hits and misses are counted in ``info["page_cache"]``.
+    """
+    if page_cache is None:
+        return lambda page_num, need="layout": _page_layout(doc[page_num], page_num, need)
+    from cache import page_digest
+
+    stats = {"hits": 0, "misses": 0}
+    if info is not None:
+        info["page_cache"] = stats
+    memo = {}
+
+    def read_page(page_num, need="layout"):
+        if page_num == 0:
+            return _page_layout(doc[0], 0)
+        digest = page_digest(doc, page_num, memo)
+        if digest is None:
+            stats["misses"] += 1
+            return _page_layout(doc[page_num], page_num, need)
+        page_layout = page_cache.get(digest)
+        if page_layout is not None:
+            stats["hits"] += 1
+            page_layout["page_num"] = page_num
+            return page_layout
+        stats["misses"] += 1
+        # Cached pages must suit every pass, so they are always parsed in reading order
+        page_layout = _page_layout(doc[page_num], page_num)
+        page_cache.put(digest, _text_only_page(page_layout))
+        return page_layout
+
+    return read_page
+
+
+def _text_only_page(page_layout):
+    """A page's blocks without their lines and spans, plus the span-derived totals later passes need"""
+    font_stats = defaultdict(int)
+    _add_font_statistics(page_layout, font_stats)
+    return {
+        "width": page_layout["width"],
+        "height": page_layout["height"],
+        "blocks": [{"bbox": block["bbox"], "text": block["text"], "max_size": block["max_size"],
+                    "is_bold": block["is_bold"]} for block in page_layout["blocks"]],
+        "summary": page_layout["summary"],
+        # Items keep first-seen order, which decides ties in the document histogram
+        "font_stats": list(font_stats.items()),
+        "numbered_fields": _page_numbered_fields(page_layout),
+        "spans": sum(len(line["spans"]) for block in page_layout["blocks"] for line in block["lines"]),
+    }
+
+
+def _page_summary(blocks):
+    """What the heading pre-filter needs to know about a page's blocks.
+
+    Only blocks of at most HEADING_MAX_CHARS characters can become headings,
+    and of those only ones reaching the lowest heading size or written as
+    short all-caps labels (which are promoted to H1).
+    """
+    short_max_size = 0
+    short_caps = False
+    for block in blocks:
+        clean_text = block["text"].strip()
+        if not clean_text or len(clean_text) > HEADING_MAX_CHARS:
+            continue
+        if block["max_size"] > short_max_size:
+            short_max_size = block["max_size"]
+        if not short_caps and _is_short_caps(clean_text):
+            short_caps = True
+    return {"short_max_size": short_max_size, "short_caps": short_caps}
+
+
+def _is_short_caps(clean_text):
+    return clean_text.isupper() and len(clean_text.split()) <= 5
+
+
+def _detect_poster(page_layout):
+    """Return the poster result for a single page, or None if it is not a poster"""
+    blocks = page_layout["blocks"]
+    all_lines = []
+    for block in blocks:
+        for line in block["lines"]:
+            clean_line = line["text"].strip()
+            if clean_line:
+                all_lines.append(clean_line)
+
+    if len(all_lines) <= 10:
+        return None
+
+    has_structural_headings = False
+    for block in blocks:
+        for line in block["lines"]:
+            clean_text = line["text"].strip()
+            if not clean_text:
                 continue
-            block_text = ""
-            for line in block.get("lines", []):
-                for span in line.get("spans", []):
-                    block_text += span.get("text", "")
-            
-            words = block_text.split()
-            if (len(block_text) > 50 and len(words) > 5 and 
-                len(set(words)) < len(words) * 0.5):
-                has_overlapping_text = True
+
+            if (re.match(r'^\d+\.\s+', clean_text) or
+                re.match(r'^\d+\.\d+\s+', clean_text) or
+                (clean_text.endswith(':') and len(clean_text.split()) <= 4 and line["max_size"] > 14)):
+                has_structural_headings = True
                 break
-        
-        if has_overlapping_text:
-            # Reconstruct title using span-based approach
-            title_spans = []
-            extended_area = fitz.Rect(0, 0, first_page.rect.width, first_page.rect.height * 0.5)
-            
-            for block in blocks:
-                block_rect = fitz.Rect(block.get("bbox", (0, 0, 0, 0)))
-                if not block_rect.intersects(extended_area):
-                    continue
-                    
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        text = span.get("text", "").strip()
-                        size = span.get("size", 0)
-                        if text and size >= body_size * 1.2:
-                            bbox = span.get('bbox', [0,0,0,0])
-                            title_spans.append({
-                                'text': text,
-                                'x': bbox[0],
-                                'y': bbox[1],
-                                'size': size,
-                            })
-
-            if title_spans:
-                title_spans.sort(key=lambda x: (x['y'], x['x']))
-                
-                # Group spans by Y positions
-                y_groups = []
-                current_group = []
-                last_y = None
-                
-                for span in title_spans:
-                    if last_y is None or abs(span['y'] - last_y) <= 5:
-                        current_group.append(span)
-                    else:
-                        if current_group:
-                            y_groups.append(current_group)
-                        current_group = [span]
-                    last_y = span['y']
-                
-                if current_group:
-                    y_groups.append(current_group)
-
-                # Reconstruct title from Y groups
-                title_parts = []
-                found_main_title = False
-                
-                for group in y_groups:
-                    group.sort(key=lambda x: x['x'])
-                    
-                    group_text = ' '.join(s['text'] for s in group).strip()
-                    words = group_text.split()
-                    
-                    if len(words) > 3 and len(set(words)) < len(words) * 0.4:
-                        continue
-                    
-                    if not found_main_title and len(group_text) > 5 and ':' in group_text:
-                        title_parts.append(group_text)
-                        found_main_title = True
-                    elif found_main_title:
-                        if (group_text and not group_text.endswith(':') and 
-                            group[0]['size'] >= 20 and 
-                            not re.match(r'.*\d{4}$', group_text) and
-                            len(set(words)) > len(words) * 0.8):
-                            title_parts.append(group_text)
-
-                full_title = ' '.join(title_parts)
-                full_title = re.sub(r'\s+', ' ', full_title).strip()
-                
-                # Apply title pattern fixes
-                if full_title.startswith('RFP:') and len(full_title.split()) >= 5:
-                    colon_pos = full_title.find(':')
-                    if colon_pos > 0 and colon_pos < 5:
-                        after_colon = full_title[colon_pos+1:].strip()
-                        if after_colon and after_colon[0] != after_colon[0].lower():
-                            first_word = after_colon.split()[0] if after_colon.split() else ""
-                            if len(first_word) <= 3:
-                                acronym = full_title[:colon_pos]
-                                full_title = full_title.replace(f'{acronym}:', f'{acronym}:Expanded Form ', 1)
-                
-                if not full_title or len(full_title) > 200 or len(full_title.split()) < 2:
-                    title_candidates = []
+        if has_structural_headings:
+            break
+
+    if has_structural_headings:
+        return None
+    if len(all_lines) >= 2:
+        return "", [{
+            "level": "H1",
+            "text": all_lines[-2] + " ",
+            "page": 0
+        }]
+    return "", []
+
+
+def _font_statistics(layout):
+    """Character count per rounded font size across the document"""
+    font_stats = defaultdict(int)
+    for page_layout in layout:
+        _add_font_statistics(page_layout, font_stats)
+    return font_stats
+
+
+def _add_font_statistics(page_layout, font_stats):
+    """Add one page's characters to the font size histogram"""
+    if "font_stats" in page_layout:
+        for size, count in page_layout["font_stats"]:
+            font_stats[size] += count
+        return
+    for block in page_layout["blocks"]:
+        for line in block["lines"]:
+            for span in line["spans"]:
+                font_stats[round(span["size"], 1)] += len(span["text"])
+
+
+def _stratified_page_order(page_count):
+    """Yield page numbers in van der Corput order so any prefix spans the whole document"""
+    seen = {0}
+    yield 0
+    denominator = 2
+    while len(seen) < page_count:
+        for numerator in range(1, denominator, 2):
+            page_num = numerator * page_count // denominator
+            if page_num not in seen:
+                seen.add(page_num)
+                yield page_num
+        denominator *= 2
+
+
+def estimate_body_size(get_page, page_count, confidence=0.95, budget=None):
+    """Estimate the body font size from a stratified sample of pages.
+
+    Pages are read in stratified order and, after a minimum sample, the leading
+    histogram bucket is tested against the runner-up with a ratio estimator of
+    their character-share difference (pages as sampling units, with finite
+    population correction). Returns ``(body_size, pages_read)``; ``body_size`` is
+    None when the document is too short to sample or the lead is not significant
+    at ``confidence`` within SAMPLE_MAX_FRACTION of the pages.
+
+    A ``budget`` (see Budget) confines the sample to its first ``max_pages``
+    pages, and running past its deadline ends the sample undecided.
+    """
+    if budget is not None and budget.max_pages is not None:
+        page_count = min(page_count, budget.max_pages)
+    if page_count < SAMPLE_MIN_DOCUMENT_PAGES:
+        return None, 0
+
+    z = NormalDist().inv_cdf(confidence)
+    max_pages = max(SAMPLE_MIN_PAGES, int(page_count * SAMPLE_MAX_FRACTION))
+    font_stats = defaultdict(int)
+    page_stats = []
+
+    for page_num in _stratified_page_order(page_count):
+        if budget is not None and budget.expired:
+            break
+        page_hist = defaultdict(int)
+        _add_font_statistics(get_page(page_num), page_hist)
+        page_stats.append(page_hist)
+        for size, count in page_hist.items():
+            font_stats[size] += count
+
+        pages_read = len(page_stats)
+        if pages_read >= SAMPLE_MIN_PAGES and (pages_read - SAMPLE_MIN_PAGES) % SAMPLE_CHECK_EVERY == 0:
+            if _sample_is_decisive(font_stats, page_stats, page_count, z):
+                return max(font_stats.items(), key=lambda x: x[1])[0], pages_read
+        if pages_read >= max_pages:
+            break
+
+    return None, len(page_stats)
+
+
+def _title_body_size(get_page, page_count, expires=None):
+    """Body size for the title from a stratified sample, when the first pass was truncated.
+
+    Up to TITLE_SAMPLE_PAGES pages are read regardless of any page limit, so a
+    title set large only relative to later pages is still found; past the
+    ``expires`` deadline (time.monotonic) only page 0 is read. Pages that fail
+    to parse are skipped. Returns ``(body_size, pages_read)``, with body_size
+    None when the sample holds no text.
+    """
+    font_stats = defaultdict(int)
+    pages_read = 0
+    for page_num in itertools.islice(_stratified_page_order(page_count), TITLE_SAMPLE_PAGES):
+        if page_num and expires is not None and time.monotonic() >= expires:
+            break
+        try:
+            page_layout = get_page(page_num)
+        except Exception:
+            continue
+        pages_read += 1
+        _add_font_statistics(page_layout, font_stats)
+    if not font_stats:
+        return None, pages_read
+    return max(font_stats.items(), key=lambda x: x[1])[0], pages_read
+
+
+def _sample_is_decisive(font_stats, page_stats, page_count, z):
+    """Whether the sampled top bucket leads the runner-up at the requested confidence"""
+    ranked = sorted(font_stats.items(), key=lambda x: x[1], reverse=True)
+    if not ranked or ranked[0][1] == 0:
+        return False
+    if len(ranked) == 1:
+        return True
+    top, second = ranked[0][0], ranked[1][0]
+
+    n = len(page_stats)
+    leads = [page_hist.get(top, 0) - page_hist.get(second, 0) for page_hist in page_stats]
+    totals = [sum(page_hist.values()) for page_hist in page_stats]
+    total_chars = sum(totals)
+    if not total_chars:
+        return False
+    ratio = sum(leads) / total_chars
+    mean_chars = total_chars / n
+    residual = sum((lead - ratio * chars) ** 2 for lead, chars in zip(leads, totals)) / (n - 1)
+    variance = residual / (n * mean_chars ** 2) * (1 - n / page_count)
+    return ratio - z * sqrt(max(variance, 0.0)) > 0
+
+
+def _extract_title(first_page, body_size, metrics=None):
+    """Extract the document title from the first page layout.
+
+    ``metrics``, if given, records which branch produced the title and counts
+    the title fixes (see rules.TITLE_FIXES) that changed it.
+    """
+    counters = metrics["counters"] if metrics is not None else None
+    title = ""
+    title_area = fitz.Rect(0, 0, first_page["width"], first_page["height"] * 0.3)
+    extended_area = fitz.Rect(0, 0, first_page["width"], first_page["height"] * 0.5)
+    title_candidates = []
+
+    blocks = first_page["blocks"]
+    # Select the regions once; every branch below reads one of them
+    extended_blocks = [block for block in blocks if fitz.Rect(block["bbox"]).intersects(extended_area)]
+    title_blocks = [block for block in extended_blocks if fitz.Rect(block["bbox"]).intersects(title_area)]
+
+    # Detect overlapping/corrupted text patterns
+    has_overlapping_text = False
+    for block in title_blocks:
+        block_text = block["text"]
+        words = block_text.split()
+        if (len(block_text) > 50 and len(words) > 5 and
+            len(set(words)) < len(words) * 0.5):
+            has_overlapping_text = True
+            break
+
+    branch = "overlap_reconstruction" if has_overlapping_text else "standard"
+    if has_overlapping_text:
+        # Reconstruct title using span-based approach
+        title_spans = []
+        for block in extended_blocks:
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    text = span["text"].strip()
+                    size = span["size"]
+                    if text and size >= body_size * 1.2:
+                        bbox = span["bbox"]
+                        title_spans.append({
+                            'text': text,
+                            'x': bbox[0],
+                            'y': bbox[1],
+                            'size': size,
+                        })
+
+        if title_spans:
+            title_spans.sort(key=lambda x: (x['y'], x['x']))
+
+            # Group spans by Y positions
+            y_groups = []
+            current_group = []
+            last_y = None
+
+            for span in title_spans:
+                if last_y is None or abs(span['y'] - last_y) <= 5:
+                    current_group.append(span)
                 else:
-                    if full_title and len(title_parts) > 1:
-                        full_title += "  "
-                    
-                    if full_title:
-                        max_size = max(span['size'] for span in title_spans)
-                        title_candidates.append((max_size, full_title))
-        else:
-            # Standard title extraction
-            for block in blocks:
-                block_rect = fitz.Rect(block.get("bbox", (0, 0, 0, 0)))
-                if not block_rect.intersects(title_area):
-                    continue
+                    if current_group:
+                        y_groups.append(current_group)
+                    current_group = [span]
+                last_y = span['y']
 
-                block_text = ""
-                max_size = 0
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        if span.get("size", 0) > max_size:
-                            max_size = span.get("size", 0)
-                        block_text += span.get("text", "")
+            if current_group:
+                y_groups.append(current_group)
 
-                if not block_text.strip() or block_text.strip().endswith(':'):
-                    continue
+            # Reconstruct title from Y groups
+            title_parts = []
+            found_main_title = False
 
-                threshold_ratio = 1.2 if max_size < body_size * 1.3 else 1.5
-                if max_size >= body_size * threshold_ratio:
-                    title_candidates.append((max_size, block_text))
+            for group in y_groups:
+                group.sort(key=lambda x: x['x'])
 
-        # Extended search if needed
-        if not title_candidates or (len(title_candidates) == 1 and not has_overlapping_text):
-            extended_area = fitz.Rect(0, 0, first_page.rect.width, first_page.rect.height * 0.5)
-            extended_candidates = []
-            
-            for block in blocks:
-                block_rect = fitz.Rect(block.get("bbox", (0, 0, 0, 0)))
-                if not block_rect.intersects(extended_area):
+                group_text = ' '.join(s['text'] for s in group).strip()
+                words = group_text.split()
+
+                if len(words) > 3 and len(set(words)) < len(words) * 0.4:
                     continue
 
-                block_text = ""
-                max_size = 0
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        if span.get("size", 0) > max_size:
-                            max_size = span.get("size", 0)
-                        block_text += span.get("text", "")
+                if not found_main_title and len(group_text) > 5 and ':' in group_text:
+                    title_parts.append(group_text)
+                    found_main_title = True
+                elif found_main_title:
+                    if (group_text and not group_text.endswith(':') and
+                        group[0]['size'] >= 20 and
+                        not re.match(r'.*\d{4}$', group_text) and
+                        len(set(words)) > len(words) * 0.8):
+                        title_parts.append(group_text)
 
-                if not block_text.strip() or block_text.strip().endswith(':'):
-                    continue
+            full_title = ' '.join(title_parts)
+            full_title = re.sub(r'\s+', ' ', full_title).strip()
 
-                if max_size >= body_size * 1.5:
-                    extended_candidates.append((max_size, block_text))
-
-            if len(extended_candidates) > 1:
-                max_font_size = max(extended_candidates, key=lambda x: x[0])[0]
-                same_size_candidates = [text for size, text in extended_candidates if size == max_font_size]
-                if len(same_size_candidates) > 1:
-                    combined_title = ""
-                    for text in same_size_candidates:
-                        combined_title += text.rstrip() + "  "
-                    title_candidates = [(max_font_size, combined_title)]
-                else:
-                    title_candidates = extended_candidates
-            elif extended_candidates:
+            # Apply title pattern fixes
+            full_title = rules.apply_title_fixes(full_title, counters)
+
+            if not full_title or len(full_title) > 200 or len(full_title.split()) < 2:
+                title_candidates = []
+            else:
+                if full_title and len(title_parts) > 1:
+                    full_title += "  "
+
+                if full_title:
+                    max_size = max(span['size'] for span in title_spans)
+                    title_candidates.append((max_size, full_title))
+    else:
+        # Standard title extraction
+        for block in title_blocks:
+            block_text = block["text"]
+            max_size = block["max_size"]
+            if not block_text.strip() or block_text.strip().endswith(':'):
+                continue
+
+            threshold_ratio = 1.2 if max_size < body_size * 1.3 else 1.5
+            if max_size >= body_size * threshold_ratio:
+                title_candidates.append((max_size, block_text))
+
+    # Extended search if needed
+    if not title_candidates or (len(title_candidates) == 1 and not has_overlapping_text):
+        extended_candidates = []
+
+        for block in extended_blocks:
+            block_text = block["text"]
+            max_size = block["max_size"]
+            if not block_text.strip() or block_text.strip().endswith(':'):
+                continue
+
+            if max_size >= body_size * 1.5:
+                extended_candidates.append((max_size, block_text))
+
+        if len(extended_candidates) > 1:
+            max_font_size = max(extended_candidates, key=lambda x: x[0])[0]
+            same_size_candidates = [text for size, text in extended_candidates if size == max_font_size]
+            if len(same_size_candidates) > 1:
+                combined_title = ""
+                for text in same_size_candidates:
+                    combined_title += text.rstrip() + "  "
+                title_candidates = [(max_font_size, combined_title)]
+            else:
                 title_candidates = extended_candidates
+            branch = "extended"
+        elif extended_candidates:
+            title_candidates = extended_candidates
+            branch = "extended"
 
-        # Final fallback
+    # Fallback title extraction if still no candidates
+    if not title_candidates:
+        for block in blocks:
+            if block["bbox"][1] > first_page["height"] * 0.3:
+                continue
 
-        # Fallback title extraction if still no candidates
-        if not title_candidates:
-            for block in blocks:
-                block_rect = fitz.Rect(block.get("bbox", (0, 0, 0, 0)))
-                if block_rect.y0 > first_page.rect.height * 0.3:
-                    continue
+            block_text = block["text"]
+            clean_text = block_text.strip()
+            if not clean_text or clean_text.endswith(':'):
+                continue
 
-                block_text = ""
-                max_size = 0
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        if span.get("size", 0) > max_size:
-                            max_size = span.get("size", 0)
-                        block_text += span.get("text", "")
+            if block["max_size"] >= body_size * 1.3:
+                title_candidates.append((block["max_size"], block_text))
+        branch = "fallback" if title_candidates else "none"
 
-                clean_text = block_text.strip()
-                if not clean_text or clean_text.endswith(':'):
-                    continue
+    if title_candidates:
+        best_title = max(title_candidates, key=lambda x: x[0])[1]
 
-                if max_size >= body_size * 1.3:
-                    title_candidates.append((max_size, block_text))
-
-        if title_candidates:
-            best_title = max(title_candidates, key=lambda x: x[0])[1]
-            
-            # Handle corrupted titles
-            words = best_title.split()
-            if len(words) > 5 and len(set(words)) < len(words) * 0.6:
-                clean_prefix = []
-                for word in words[:5]:
-                    if not any(char * 2 in word.lower() for char in 'abcdefghijklmnopqrstuvwxyz'):
-                        clean_prefix.append(word)
-                    else:
-                        break
-                
-                clean_continuation = None
-                for block in blocks:
-                    block_text = ""
-                    max_size = 0
-                    for line in block.get("lines", []):
-                        for span in line.get("spans", []):
-                            if span.get("size", 0) > max_size:
-                                max_size = span.get("size", 0)
-                            block_text += span.get("text", "")
-                    
-                    block_words = block_text.split()
-                    word_length_avg = sum(len(word) for word in block_words) / len(block_words) if block_words else 0
-                    if (max_size >= body_size * 1.3 and 
-                        len(block_words) > 5 and 
-                        len(set(block_words)) > len(block_words) * 0.8 and
-                        word_length_avg > 5):
-                        clean_continuation = block_text.strip()
-                        break
-                
-                if clean_prefix and clean_continuation:
-                    title = " ".join(clean_prefix) + " " + clean_continuation
-                elif clean_continuation:
-                    title = clean_continuation
+        # Handle corrupted titles
+        words = best_title.split()
+        if len(words) > 5 and len(set(words)) < len(words) * 0.6:
+            branch += "+corruption_repair"
+            clean_prefix = []
+            for word in words[:5]:
+                if not any(char * 2 in word.lower() for char in 'abcdefghijklmnopqrstuvwxyz'):
+                    clean_prefix.append(word)
                 else:
-                    clean_words = [w for w in words if not any(char * 3 in w.lower() for char in 'abcdefghijklmnopqrstuvwxyz')]
-                    if len(clean_words) >= 4:
-                        title = " ".join(clean_words)
-                    else:
-                        title = best_title
-            else:
-                title = best_title
-        
-        # Apply title fixes
-        title = title.lstrip()
-        
-        if title.startswith('RFP:') and len(title.split()) >= 5:
-            colon_pos = title.find(':')
-            if colon_pos > 0 and colon_pos < 5:
-                after_colon = title[colon_pos+1:].strip()
-                if after_colon and after_colon[0] != after_colon[0].lower():
-                    first_word = after_colon.split()[0] if after_colon.split() else ""
-                    if len(first_word) <= 3:
-                        acronym = title[:colon_pos]
-                        title = title.replace(f'{acronym}:', f'{acronym}:Expanded Form ', 1)
-        
-        if title and not title.endswith("  ") and " " in title:
-            if len(title.split()) >= 6:
-                title = title.rstrip() + "  "
-            elif not title.endswith(" "):
-                title = title + " "
+                    break
 
-        # Document classification for heading extraction
-        is_form_document = False
-        numbered_fields = 0
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            blocks = page.get_text("dict", sort=True).get("blocks", [])
+            clean_continuation = None
             for block in blocks:
-                block_text = ""
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        block_text += span.get("text", "")
-                clean_text = block_text.strip()
-                if re.match(r'^\d+\.\s+[A-Z]', clean_text) and len(clean_text.split()) <= 8:
-                    numbered_fields += 1
-        
-        title_lower = str(title).lower()
-        title_words = title_lower.split()
-        
-        has_complex_structure = (len(title_words) >= 10 or ':' in title or any(len(word) > 12 for word in title_words))
-        title_char_length = len(title.replace(' ', ''))
-        avg_word_length = sum(len(word) for word in title_words) / len(title_words) if title_words else 0
-        
-        has_form_indicators = (len(title_words) <= 9 and numbered_fields >= 5 and 
-                             avg_word_length <= 5.5 and title_char_length <= 35 and 
-                             not has_complex_structure)
-        
-        if has_form_indicators:
-            is_form_document = True
+                block_text = block["text"]
+                block_words = block_text.split()
+                word_length_avg = sum(len(word) for word in block_words) / len(block_words) if block_words else 0
+                if (block["max_size"] >= body_size * 1.3 and
+                    len(block_words) > 5 and
+                    len(set(block_words)) > len(block_words) * 0.8 and
+                    word_length_avg > 5):
+                    clean_continuation = block_text.strip()
+                    break
 
-        # Extract headings unless form document
-        headings = []
-        if is_form_document:
-            return title, []
+            if clean_prefix and clean_continuation:
+                title = " ".join(clean_prefix) + " " + clean_continuation
+            elif clean_continuation:
+                title = clean_continuation
+            else:
+                clean_words = [w for w in words if not any(char * 3 in w.lower() for char in 'abcdefghijklmnopqrstuvwxyz')]
+                if len(clean_words) >= 4:
+                    title = " ".join(clean_words)
+                else:
+                    title = best_title
+        else:
+            title = best_title
 
-        heading_thresholds = [(1.35, "H1"), (1.05, "H2"), (1.0, "H3")]
-        previous_level = 0
-        previous_y = 0
-        found_main_headings = []
+    # Apply title fixes
+    title = title.lstrip()
+    title = rules.apply_title_fixes(title, counters)
 
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            blocks = page.get_text("dict", sort=True).get("blocks", [])
+    if title and not title.endswith("  ") and " " in title:
+        if len(title.split()) >= 6:
+            title = title.rstrip() + "  "
+        elif not title.endswith(" "):
+            title = title + " "
 
-            for block in blocks:
-                block_text = ""
-                max_size = 0
-                is_bold = False
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        if "bold" in span.get("font", "").lower():
-                            is_bold = True
-                        if span.get("size", 0) > max_size:
-                            max_size = span.get("size", 0)
-                        block_text += span.get("text", "")
-
-                clean_text = block_text.strip()
-                if not clean_text:
-                    continue
+    if metrics is not None:
+        metrics["title_branch"] = branch
+    return title
 
-                x0, y0, x1, y1 = block.get("bbox", (0, 0, 0, 0))
 
-                # Skip header/footer areas
-                if y0 < page.rect.height * 0.05 or y0 > page.rect.height * 0.90:
-                    continue
+def _count_numbered_fields(layout):
+    """Count short numbered-field blocks such as '1. Name' across the document"""
+    return sum(_page_numbered_fields(page_layout) for page_layout in layout)
 
-                skip_as_subsection = False
-                for main_heading in found_main_headings:
-                    main_words = set(main_heading.upper().split())
-                    current_words = set(clean_text.upper().split())
-                    if (len(main_words.intersection(current_words)) >= 1 and 
-                        clean_text.upper() != main_heading.upper() and
-                        len(current_words) <= len(main_words) + 2):
-                        skip_as_subsection = True
-                        break
-                
-                if skip_as_subsection:
-                    continue
 
-                # Skip unwanted content
-                if (title and clean_text.strip() in title.strip()) or \
-                   (len(clean_text) > 100) or \
-                   (len(clean_text.split()) > 5 and len(set(clean_text.split())) < len(clean_text.split()) * 0.6) or \
-                   (re.match(r'.\b\d{4}\b.', clean_text)) or \
-                   (len(clean_text.split()) > 3 and len(clean_text) < 50 and page_num == 0) or \
-                   (len(clean_text.strip()) <= 6 and clean_text.strip().endswith(':') and len(clean_text.strip()) <= 4):
-                    continue
+def _page_numbered_fields(page_layout):
+    """Count short numbered-field blocks on one page"""
+    if "numbered_fields" in page_layout:
+        return page_layout["numbered_fields"]
+    numbered_fields = 0
+    for block in page_layout["blocks"]:
+        clean_text = block["text"].strip()
+        if re.match(r'^\d+\.\s+[A-Z]', clean_text) and len(clean_text.split()) <= 8:
+            numbered_fields += 1
+    return numbered_fields
 
-                # Skip wide content unless short all-caps
-                if not (clean_text.isupper() and len(clean_text.split()) <= 5):
-                    has_good_ratio = any(max_size >= body_size * ratio for ratio, _ in heading_thresholds)
-                    if not has_good_ratio and (x1 - x0) > page.rect.width * 0.85:
-                        continue
 
-                if len(clean_text.split()) > 25 and not clean_text.isupper():
-                    continue
+def _heading_rule_set(title, numbered_fields, rule_sets=None, metrics=None):
+    """Classify the document (see rules.DOCUMENT_TYPES) and return its heading rule set name.
+
+    None means the document type gets no heading pass; ``metrics["path"]`` is
+    then set to the type name. ``rule_sets`` overrides rules.DOCUMENT_RULE_SETS.
+    """
+    document_type = rules.classify_document(title, numbered_fields)
+    rule_set = rules.rule_set_for(document_type, rule_sets)
+    if rule_set is None and metrics is not None:
+        metrics["path"] = document_type
+    return rule_set
+
+
+class _MainHeadingIndex:
+    """Inverted word index over the main (all-caps) headings found so far.
+
+    A block is suppressed as a subsection when some main heading shares a word
+    with it, is not the same text, and has at least ``len(block words) - 2``
+    words. For each word the index keeps the two largest distinct main
+    headings containing it, which is enough to answer that question exactly, so
+    a check costs time proportional to the block's own words.
+    """
+
+    def __init__(self):
+        self.top = {}
+        self.seen = set()
+
+    def add(self, text):
+        upper = text.upper()
+        if upper in self.seen:
+            return
+        self.seen.add(upper)
+        words = set(upper.split())
+        entry = (len(words), upper)
+        for word in words:
+            best = self.top.get(word)
+            if best is None:
+                self.top[word] = (entry,)
+            elif entry[0] > best[0][0]:
+                self.top[word] = (entry, best[0])
+            elif len(best) == 1 or entry[0] > best[1][0]:
+                self.top[word] = (best[0], entry)
+
+    def suppresses(self, upper, words):
+        """Whether a block with uppercased text ``upper`` and word set ``words`` is a subsection"""
+        needed = len(words) - 2
+        for word in words:
+            best = self.top.get(word)
+            if best is None:
+                continue
+            for count, main_upper in best:
+                if count < needed:
+                    break
+                if main_upper != upper:
+                    return True
+        return False
+
+
+def _new_heading_state():
+    """Heading-pass state carried from one page to the next"""
+    return {"previous_level": 0, "previous_y": 0, "main_index": _MainHeadingIndex()}
+
+
+def _page_headings(page_layout, body_size, title, state, levels=None, rejected=None, counters=None,
+                   rule_set="default"):
+    """Collect the headings of one page, updating the carried heading state.
+
+    ``rejected``, if given, counts discarded blocks per filter rule, and
+    ``counters`` the pages and blocks the pre-filter skipped and the heading
+    pattern each candidate matched.
+    """
+    headings = []
+    for candidate in _page_candidates(page_layout, body_size, title, levels, rejected, counters, rule_set):
+        heading = _accept_candidate(candidate, state, rejected)
+        if heading is not None:
+            headings.append(heading)
+    return headings
+
+
+def _page_candidates(page_layout, body_size, title, levels=None, rejected=None, counters=None,
+                     rule_set="default"):
+    """Run the heading rules that do not depend on earlier pages.
+
+    Returns candidates in block order for _accept_candidate. A block rejected
+    here keeps its ``reason`` so the subsection check, which comes first, can
+    still claim it; such blocks are only returned when ``rejected`` is counted.
+    ``rule_set`` names the rules.RULE_SETS entry to apply.
+
+    For rule sets marked "prefilter", pages and blocks that cannot hold a heading
+    (see _page_summary) are skipped before any other rule and counted under the
+    "prefilter" rule. Blocks rejected this way never reach the heading state, so
+    output is unchanged.
+    """
+    candidates = []
+    page_num = page_layout["page_num"]
+    page_height = page_layout["height"]
+    page_width = page_layout["width"]
+    rules_table = rules.RULE_SETS[rule_set]
+    prefilter = rules_table["prefilter"]
+    min_size = body_size * HEADING_THRESHOLDS[-1][0]
+
+    summary = page_layout["summary"]
+    if prefilter and summary["short_max_size"] < min_size and not summary["short_caps"]:
+        if counters is not None:
+            counters["prefilter_pages_skipped"] += 1
+            counters["prefilter_blocks_skipped"] += len(page_layout["blocks"])
+        if rejected is not None:
+            rejected["prefilter"] += len(page_layout["blocks"])
+        return candidates
+    if counters is not None and prefilter:
+        counters["prefilter_pages_scanned"] += 1
+
+    for block in page_layout["blocks"]:
+        block_text = block["text"]
+        clean_text = block_text.strip()
+        if not clean_text:
+            if rejected is not None:
+                rejected["empty"] += 1
+            continue
+
+        if prefilter and (len(clean_text) > HEADING_MAX_CHARS or
+                          (block["max_size"] < min_size and not _is_short_caps(clean_text))):
+            if counters is not None:
+                counters["prefilter_blocks_skipped"] += 1
+            if rejected is not None:
+                rejected["prefilter"] += 1
+            continue
+
+        y0 = block["bbox"][1]
 
-                # Assign heading level based on font size
-                level = None
-                for ratio, lvl in heading_thresholds:
-                    if max_size >= body_size * ratio:
-                        level = lvl
+        # Skip header/footer areas
+        if y0 < page_height * 0.05 or y0 > page_height * 0.90:
+            if rejected is not None:
+                rejected["header_footer"] += 1
+            continue
+
+        features = rules.BlockFeatures(block, clean_text, page_num, page_width, body_size, title, levels)
+        level, pattern, reason = rules.classify_block(rules_table, features)
+        if reason:
+            if rejected is not None:
+                candidates.append({"text": clean_text, "reason": reason})
+            continue
+        if counters is not None:
+            counters[f"heading_pattern_{pattern}"] += 1
+
+        candidates.append({
+            "text": clean_text,
+            "reason": None,
+            "level": int(level[1:]),
+            "y": y0,
+            "heading": {"level": level, "text": block_text.rstrip() + " ", "page": page_num},
+        })
+
+    return candidates
+
+
+def _accept_candidate(candidate, state, rejected=None):
+    """Apply the order-dependent heading checks; returns the heading or None"""
+    clean_text = candidate["text"]
+    clean_upper = clean_text.upper()
+    if state["main_index"].suppresses(clean_upper, set(clean_upper.split())):
+        if rejected is not None:
+            rejected["subsection"] += 1
+        return None
+
+    if candidate["reason"]:
+        if rejected is not None:
+            rejected[candidate["reason"]] += 1
+        return None
+
+    # Track main headings
+    if _is_short_caps(clean_text):
+        state["main_index"].add(clean_text)
+
+    current_level = candidate["level"]
+    if current_level < state["previous_level"]:
+        state["previous_level"] = current_level
+    elif current_level > state["previous_level"] + 1 and abs(candidate["y"] - state["previous_y"]) < 50:
+        if rejected is not None:
+            rejected["level_jump"] += 1
+        return None
+    else:
+        state["previous_level"] = current_level
+
+    state["previous_y"] = candidate["y"]
+    return candidate["heading"]
+
+
+def _extract_headings(layout, body_size, title, levels=None, rejected=None, counters=None, rule_set="default"):
+    """Walk every page layout and collect hierarchical headings.
+
+    ``levels`` optionally supplies precomputed level numbers indexed by block id
+    (see span_table.heading_levels) in place of the per-block threshold loop.
+    """
+    headings = []
+    state = _new_heading_state()
+    for page_layout in layout:
+        headings.extend(_page_headings(page_layout, body_size, title, state, levels, rejected, counters,
+                                       rule_set))
+
+    # Clean up duplicate title in headings
+    if headings and headings[0]["text"].strip() == title.strip():
+        headings = headings[1:]
+
+    return headings
+
+
+def new_metrics():
+    """Empty per-document instrumentation record"""
+    return {
+        "path": None,
+        "title_branch": None,
+        "stages": {},
+        "counters": defaultdict(int),
+        "rejected": defaultdict(int),
+    }
+
+
+def _stage_timer(metrics):
+    """Return lap(name), which charges the time since the previous lap to a stage"""
+    if metrics is None:
+        return lambda name: None
+    stages = metrics["stages"]
+    memory = metrics.get("memory")
+    last = [time.perf_counter()]
+
+    def lap(name):
+        now = time.perf_counter()
+        stages[name] = stages.get(name, 0.0) + now - last[0]
+        last[0] = now
+        if memory is not None:
+            memory.sample(name)
+            # Sampling cost is not charged to the next stage
+            last[0] = time.perf_counter()
+
+    return lap
+
+
+def _count_page(metrics, page_layout):
+    """Add one scanned page to the block/span counters"""
+    counters = metrics["counters"]
+    counters["blocks"] += len(page_layout["blocks"])
+    if "spans" in page_layout:
+        counters["spans"] += page_layout["spans"]
+    else:
+        counters["spans"] += sum(len(line["spans"]) for block in page_layout["blocks"] for line in block["lines"])
+
+
+def stream_title_headings(pdf_path, sample_body_size=False, sample_confidence=0.95, info=None, metrics=None,
+                          budget=None, rule_sets=None, page_cache=None):
+    """Return the title and a generator that yields outline entries page by page.
+
+    Memory stays roughly constant regardless of page count: a first pass builds
+    the font histogram and numbered-field count one page at a time, and the
+    heading pass then parses, scans and drops each page in turn. The document
+    stays open until the generator is exhausted or closed.
+
+    With ``sample_body_size`` the first pass reads only a stratified sample of
+    pages (see estimate_body_size), falling back to the full pass when the sample
+    is ambiguous; numbered fields are then only counted if the title looks like a
+    form's. ``info``, if given, receives the method used and pages read, and
+    ``metrics`` (see new_metrics) receives stage timings and counters.
+
+    A ``budget`` (see Budget) bounds both passes: the first may use half the
+    remaining time, and the heading pass never reads past the pages it
+    counted. ``info["truncated"]`` then records where the outline stops.
+    ``rule_sets`` overrides the heading rule set per document type (see
+    rules.DOCUMENT_RULE_SETS). With a ``page_cache`` (see cache.PageCache),
+    both passes read pages through it.
+    """
+    budget = budget or Budget()
+    # The first pass may spend half the time left, leaving the rest for headings
+    first_pass = budget.share(0.5)
+    lap = _stage_timer(metrics)
+    doc = open_document(pdf_path)
+    try:
+        lap("open")
+        page_count = len(doc)
+        first_page = _page_layout(doc[0], 0) if page_count else None
+        if metrics is not None:
+            metrics["counters"]["pages"] = page_count
+            if first_page is not None:
+                metrics["counters"]["pages_parsed"] += 1
+        read_page = _page_reader(doc, page_cache, info)
+
+        def get_page(page_num, need="layout"):
+            if page_num == 0:
+                return first_page
+            if metrics is not None:
+                metrics["counters"]["pages_parsed"] += 1
+            return read_page(page_num, need)
+
+        lap("layout")
+
+        # Single page poster detection
+        if page_count == 1:
+            poster = _detect_poster(first_page)
+            lap("poster")
+            if poster is not None:
+                if metrics is not None:
+                    metrics["path"] = "poster"
+                doc.close()
+                return poster[0], iter(poster[1])
+
+        body_size = None
+        numbered_fields = None
+        sample_pages = 0
+        full_pages = 0
+        if sample_body_size:
+            body_size, sample_pages = estimate_body_size(get_page, page_count, sample_confidence, first_pass)
+
+        if body_size is None:
+            # Lightweight first pass: font statistics and numbered fields only
+            font_stats = defaultdict(int)
+            numbered_fields = 0
+            for page_num in range(page_count):
+                page_layout = first_pass.read(get_page, page_num, page_count)
+                if page_layout is None:
+                    break
+                full_pages += 1
+                _add_font_statistics(page_layout, font_stats)
+                numbered_fields += _page_numbered_fields(page_layout)
+                page_layout = None
+
+            if not font_stats:
+                if metrics is not None:
+                    metrics["path"] = "empty"
+                if first_pass.truncated:
+                    budget.truncated = first_pass.truncated
+                    if info is not None:
+                        info["truncated"] = budget.truncated
+                doc.close()
+                return "", iter([])
+
+            body_size = max(font_stats.items(), key=lambda x: x[1])[0]
+        lap("font_stats")
+        if first_pass.truncated:
+            budget.cap(first_pass.truncated)
+            budget.truncated = first_pass.truncated
+
+        if info is not None:
+            if budget.truncated:
+                info["truncated"] = budget.truncated
+            # Distinct pages: a fallback full pass rereads the sampled pages it reaches
+            sampled = itertools.islice(_stratified_page_order(min(page_count, first_pass.max_pages or page_count)),
+                                       sample_pages)
+            pages_read = full_pages + sum(1 for page_num in sampled if page_num >= full_pages)
+            info["body_size"] = {
+                "method": "full" if numbered_fields is not None else "sampled",
+                "value": body_size,
+                "pages_read": pages_read,
+                "sample_pages": sample_pages,
+                "page_count": page_count,
+                "fallback": sample_pages > 0 and numbered_fields is not None,
+            }
+
+        title_size = body_size
+        if first_pass.truncated:
+            title_size, title_pages = _title_body_size(get_page, page_count, budget.expires)
+            title_size = title_size or body_size
+            if info is not None:
+                info["title_body_size"] = {"value": title_size, "pages_read": title_pages}
+        title = _extract_title(first_page, title_size, metrics)
+        lap("title")
+
+        if numbered_fields is None:
+            # Sampled statistics: only forms need the numbered-field count
+            numbered_fields = 0
+            if rules.has_form_title(title):
+                for page_num in range(page_count):
+                    page_layout = budget.read(lambda n: get_page(n, "numbered_fields"), page_num, page_count)
+                    if page_layout is None:
+                        break
+                    numbered_fields += _page_numbered_fields(page_layout)
+                    if numbered_fields >= FORM_MIN_NUMBERED_FIELDS:
                         break
 
-                if not level and clean_text.isupper() and len(clean_text.split()) <= 5:
-                    level = "H1"
+        rule_set = _heading_rule_set(title, numbered_fields, rule_sets, metrics)
+        lap("classify")
+        if rule_set is None:
+            doc.close()
+            return title, iter([])
+    except BaseException:
+        doc.close()
+        raise
 
-                if not level:
-                    continue
+    if metrics is not None:
+        metrics["path"] = "full"
+    return title, _stream_headings(doc, first_page, body_size, title, metrics=metrics, budget=budget, info=info,
+                                   rule_set=rule_set, read_page=read_page)
 
-                # Pattern matching for valid headings
-                is_heading = (clean_text.isupper() and len(clean_text.split()) <= 5) or \
-                           (re.search(r':\s*$', clean_text) and is_bold) or \
-                           re.match(r'^\d+\.\s+', clean_text) or \
-                           re.match(r'^\d+\.\d+\s+', clean_text) or \
-                           re.match(r'^[A-Z][a-z]', clean_text) or \
-                           (clean_text.isupper() and len(clean_text.split()) > 1) or \
-                           (is_bold and max_size >= body_size * 1.3) or \
-                           (max_size >= body_size * 1.3 and len(clean_text.split()) <= 15) or \
-                           (len(clean_text.split()) == 1 and max_size >= body_size * 1.25)
-
-                if not is_heading:
+
+def _stream_headings(doc, first_page, body_size, title, *, metrics=None, budget=None, info=None,
+                     rule_set="default", read_page=None):
+    """Yield headings page by page, closing the document when done"""
+    rejected = metrics["rejected"] if metrics is not None else None
+    budget = budget or Budget()
+    read_page = read_page or (lambda n: _page_layout(doc[n], n))
+    try:
+        state = _new_heading_state()
+        is_first = True
+        for page_num in range(len(doc)):
+            lap = _stage_timer(metrics)
+            if page_num == 0:
+                page_layout, first_page = first_page, None
+            else:
+                page_layout = budget.read(read_page, page_num, len(doc))
+                if page_layout is None:
+                    break
+            if metrics is not None:
+                if page_num:
+                    metrics["counters"]["pages_parsed"] += 1
+                _count_page(metrics, page_layout)
+            page_headings = _page_headings(page_layout, body_size, title, state, rejected=rejected,
+                                           counters=metrics["counters"] if metrics is not None else None,
+                                           rule_set=rule_set)
+            lap("headings")
+            for heading in page_headings:
+                # Clean up duplicate title in headings
+                if is_first and heading["text"].strip() == title.strip():
+                    is_first = False
                     continue
+                is_first = False
+                if metrics is not None:
+                    metrics["counters"]["headings"] += 1
+                yield heading
+        if info is not None and budget.truncated:
+            info["truncated"] = budget.truncated
+    finally:
+        doc.close()
 
-                # Track main headings
-                if clean_text.isupper() and len(clean_text.split()) <= 5:
-                    found_main_headings.append(clean_text)
 
-                current_level = int(level[1:])
-                if current_level < previous_level:
-                    previous_level = current_level
-                elif current_level > previous_level + 1 and abs(y0 - previous_y) < 50:
-                    continue
-                else:
-                    previous_level = current_level
+def read_embedded_outline(pdf_path):
+    """Title and outline from the PDF's bookmarks and metadata, without any layout extraction.
+
+    Returns None when the bookmark tree fails the quality checks: at least
+    OUTLINE_MIN_ENTRIES entries, depth at most OUTLINE_MAX_DEPTH, a top-level
+    first entry, non-empty titles, every page in range and, for multi-page
+    documents, more than one distinct page. Entries below H3 are dropped. The
+    title is None when the metadata title is missing or looks like a file name.
+    """
+    try:
+        doc = open_document(pdf_path)
+    except Exception:
+        return None
+    try:
+        page_count = len(doc)
+        toc = doc.get_toc(simple=True)
+        metadata = doc.metadata or {}
+    except Exception:
+        return None
+    finally:
+        doc.close()
+
+    if len(toc) < OUTLINE_MIN_ENTRIES or toc[0][0] != 1:
+        return None
+    outline = []
+    pages = set()
+    for level, text, page in toc:
+        clean_text = re.sub(r'\s+', ' ', text).strip()
+        if not clean_text or not 1 <= level <= OUTLINE_MAX_DEPTH or not 1 <= page <= page_count:
+            return None
+        pages.add(page)
+        if level <= 3:
+            outline.append({"level": f"H{level}", "text": clean_text + " ", "page": page - 1})
+    if page_count > 1 and len(pages) < 2:
+        return None
+
+    title = re.sub(r'\s+', ' ', metadata.get("title") or "").strip()
+    if not title or re.search(r'\.(pdf|docx?|pptx?|xlsx?|rtf|txt|indd)$', title, re.IGNORECASE) or \
+       title.lower() in ("untitled", "title", "document"):
+        title = None
+    return title, outline
+
+
+def _heuristic_title(pdf_path):
+    """Title alone, from page 0 and a sampled body size.
+
+    The body size comes from estimate_body_size, or from page 0 alone when the
+    document is too short to sample or the sample is undecided, so at most
+    SAMPLE_MAX_FRACTION of the pages are parsed.
+    """
+    doc = open_document(pdf_path)
+    try:
+        page_count = len(doc)
+        if not page_count:
+            return ""
+        first_page = _page_layout(doc[0], 0)
+        if page_count == 1 and _detect_poster(first_page) is not None:
+            return ""
+        body_size, _ = estimate_body_size(
+            lambda page_num: first_page if page_num == 0 else _page_layout(doc[page_num], page_num), page_count)
+    finally:
+        doc.close()
+    if body_size is None:
+        font_stats = defaultdict(int)
+        _add_font_statistics(first_page, font_stats)
+        if not font_stats:
+            return ""
+        body_size = max(font_stats.items(), key=lambda x: x[1])[0]
+    return _extract_title(first_page, body_size)
+
+
+def compare_outlines(embedded, result):
+    """Agreement between the embedded outline and a heuristic (title, outline) result"""
+    def normalize(text):
+        return re.sub(r'\s+', ' ', text).strip().casefold()
+
+    title, outline = result
+    comparison = {"embedded_usable": embedded is not None, "heuristic_entries": len(outline)}
+    if embedded is None:
+        return comparison
+    embedded_title, embedded_outline = embedded
+    remaining = defaultdict(list)
+    for entry in embedded_outline:
+        remaining[(normalize(entry["text"]), entry["page"])].append(entry["level"])
+    matched = 0
+    level_matches = 0
+    for entry in outline:
+        levels = remaining.get((normalize(entry["text"]), entry["page"]))
+        if levels:
+            matched += 1
+            level = levels.pop(0)
+            level_matches += level == entry["level"]
+    comparison.update({
+        "embedded_entries": len(embedded_outline),
+        "matched": matched,
+        "level_matches": level_matches,
+        "title_match": embedded_title is not None and normalize(embedded_title) == normalize(title),
+    })
+    return comparison
+
+
+def extract_title_headings(pdf_path, columnar=False, streaming=False, sample_body_size=False,
+                           sample_confidence=0.95, info=None, instrument=False, shards=0,
+                           outline_mode="heuristic", deadline=None, max_pages=None, rule_sets=None,
+                           page_cache=None, trace_memory=False):
+    """Extract title and hierarchical headings from PDF using universal algorithms.
+
+    With ``columnar`` set, spans are held in NumPy arrays (see span_table) and the
+    font statistics and heading levels are computed in bulk. With ``streaming``
+    set, pages are processed one at a time (see stream_title_headings), and
+    ``sample_body_size`` estimates the body size from a sample of pages. With
+    ``shards`` above 1, long documents are split into page ranges parsed by that
+    many worker processes (see page_shards).
+
+    ``outline_mode`` chooses between the heuristics ("heuristic"), the PDF's own
+    bookmarks when they pass read_embedded_outline's checks ("prefer-outline"),
+    or the heuristic result plus a comparison with the bookmarks ("compare").
+    Bookmark results record in ``info["title_source"]`` whether the title came
+    from the metadata or, when that is missing, from the heuristics.
+
+    ``deadline`` (seconds) and ``max_pages`` bound the pages parsed. The title
+    is always taken from page 0; past the budget, or at a page that fails to
+    parse, the outline covers only the pages read and ``info["truncated"]``
+    gives the reason and last page.
+
+    ``rule_sets`` maps document types (see rules.DOCUMENT_TYPES) to the name of
+    a rules.RULE_SETS entry, or None to skip their heading pass, overriding
+    rules.DOCUMENT_RULE_SETS.
+
+    ``page_cache`` (a cache.PageCache or its directory) reuses the text-only
+    layout of pages already parsed in any document, so a revised document only
+    parses its changed pages; ``info["page_cache"]`` counts hits and misses.
+
+    ``trace_memory`` implies ``instrument`` and records tracemalloc and RSS
+    peaks per stage and for the document in ``metrics["memory"]`` (see
+    memory.MemoryTrace); tracemalloc slows extraction severalfold.
+    ``info``, if given, is filled with diagnostic details about the run,
+    including ``info["source"]`` outside the default mode and
+    ``info["error"]`` when extraction failed and ("", []) was returned; with
+    ``instrument`` set it also receives ``info["metrics"]`` (see new_metrics).
+    """
+    if columnar and streaming:
+        raise ValueError("columnar and streaming modes cannot be combined")
+    if sample_body_size and not streaming:
+        raise ValueError("sampled body size estimation requires streaming mode")
+    if shards > 1 and (columnar or streaming):
+        raise ValueError("page sharding cannot be combined with columnar or streaming mode")
+    if outline_mode not in OUTLINE_MODES:
+        raise ValueError(f"outline_mode must be one of {', '.join(OUTLINE_MODES)}")
+    budget = Budget(deadline, max_pages)
+    if budget.active and (columnar or shards > 1):
+        raise ValueError("deadline and max_pages cannot be combined with columnar mode or page sharding")
+    if page_cache is not None and (columnar or shards > 1):
+        raise ValueError("a page cache cannot be combined with columnar mode or page sharding")
+    if isinstance(page_cache, str):
+        from cache import PageCache
+        page_cache = PageCache(page_cache)
+
+    metrics = None
+    if instrument or trace_memory:
+        metrics = new_metrics()
+        if info is not None:
+            info["metrics"] = metrics
+    options = {"columnar": columnar, "streaming": streaming, "sample_body_size": sample_body_size,
+               "sample_confidence": sample_confidence, "shards": shards, "budget": budget, "rule_sets": rule_sets,
+               "page_cache": page_cache}
+    if not trace_memory:
+        return _extract_outline_mode(pdf_path, outline_mode, info, metrics, options)
+
+    from memory import MemoryTrace
+    metrics["memory"] = MemoryTrace()
+    try:
+        return _extract_outline_mode(pdf_path, outline_mode, info, metrics, options)
+    finally:
+        metrics["memory"] = metrics["memory"].finish()
+
+
+def _extract_outline_mode(pdf_path, outline_mode, info, metrics, options):
+    """Heuristic extraction combined with the PDF's bookmarks as ``outline_mode`` asks.
+
+    ``options`` holds _extract_heuristic's keywords.
+    """
+    def heuristic():
+        return _extract_heuristic(pdf_path, info=info, metrics=metrics, **options)
+
+    if outline_mode == "heuristic":
+        return heuristic()
+
+    lap = _stage_timer(metrics)
+    embedded = read_embedded_outline(pdf_path)
+    lap("embedded_outline")
+    if embedded is not None and outline_mode == "prefer-outline":
+        title, outline = embedded
+        if info is not None:
+            info["title_source"] = "metadata" if title is not None else "heuristic"
+        if title is None:
+            try:
+                title = _heuristic_title(pdf_path)
+            except Exception as e:
+                print(f"Error processing {_source_name(pdf_path)}: {str(e)}")
+                title = ""
+            lap("title")
+        if info is not None:
+            info["source"] = "outline"
+        if metrics is not None:
+            metrics["path"] = "outline"
+            metrics["counters"]["headings"] = len(outline)
+        return title, outline
+
+    result = heuristic()
+    if info is not None:
+        info["source"] = "heuristic"
+        if outline_mode == "compare":
+            info["outline_comparison"] = compare_outlines(embedded, result)
+    return result
+
+
+def _extract_heuristic(pdf_path, *, columnar, streaming, sample_body_size, sample_confidence, shards, budget,
+                       info, metrics, rule_sets=None, page_cache=None):
+    """Font-statistics and heading heuristics in the mode chosen by extract_title_headings"""
+    if streaming:
+        try:
+            title, outline = stream_title_headings(pdf_path, sample_body_size=sample_body_size,
+                                                   sample_confidence=sample_confidence, info=info, metrics=metrics,
+                                                   budget=budget, rule_sets=rule_sets, page_cache=page_cache)
+            return title, list(outline)
+        except Exception as e:
+            if metrics is not None:
+                metrics["path"] = "error"
+                metrics["error"] = str(e)
+            if info is not None:
+                info["error"] = str(e)
+            print(f"Error processing {_source_name(pdf_path)}: {str(e)}")
+            return "", []
+
+    lap = _stage_timer(metrics)
+    try:
+        doc = open_document(pdf_path)
+        lap("open")
+        if shards > 1:
+            import page_shards
+            if len(page_shards.shard_ranges(len(doc), shards)) > 1:
+                return page_shards.extract_sharded(pdf_path, doc, shards, info=info, metrics=metrics,
+                                                   rule_sets=rule_sets)
+        table = None
+        read_page = None
+        if columnar:
+            import span_table
+            layout, table = span_table.build_span_table(doc)
+        else:
+            if page_cache is not None:
+                read_page = _page_reader(doc, page_cache, info)
+            layout = build_layout(doc, budget if budget.active else None, read_page)
+        lap("layout")
 
-                previous_y = y0
-                headings.append({"level": level, "text": block_text.rstrip() + " ", "page": page_num})
+        if metrics is not None:
+            metrics["counters"]["pages"] = len(doc)
+            metrics["counters"]["pages_parsed"] = len(layout)
+            if table is not None:
+                metrics["counters"]["blocks"] = table["n_blocks"]
+                metrics["counters"]["spans"] = len(table["size"])
+            else:
+                for page_layout in layout:
+                    _count_page(metrics, page_layout)
 
-        # Clean up duplicate title in headings
-        if headings and headings[0]["text"].strip() == title.strip():
-            headings = headings[1:]
+        # Single page poster detection
+        if len(doc) == 1:
+            poster = _detect_poster(layout[0])
+            lap("poster")
+            if poster is not None:
+                if metrics is not None:
+                    metrics["path"] = "poster"
+                return poster
 
+        # Analyze font statistics
+        if table is not None:
+            body_size = span_table.body_size(table)
+        else:
+            font_stats = _font_statistics(layout)
+            body_size = max(font_stats.items(), key=lambda x: x[1])[0] if font_stats else None
+        lap("font_stats")
+        if body_size is None:
+            if metrics is not None:
+                metrics["path"] = "empty"
+            return "", []
+
+        if info is not None:
+            info["body_size"] = {"method": "full", "value": body_size, "pages_read": len(layout),
+                                 "sample_pages": 0, "page_count": len(doc), "fallback": False}
+
+        # Extract title from first page; a truncated layout's statistics may not reflect the body text
+        title_size = body_size
+        if budget.truncated:
+            read_page = read_page or (lambda n: _page_layout(doc[n], n))
+            title_size, title_pages = _title_body_size(
+                lambda n: layout[n] if n < len(layout) else read_page(n), len(doc), budget.expires)
+            title_size = title_size or body_size
+            if info is not None:
+                info["title_body_size"] = {"value": title_size, "pages_read": title_pages}
+        title = _extract_title(layout[0], title_size, metrics)
+        lap("title")
+
+        # Document classification for heading extraction
+        numbered_fields = _count_numbered_fields(layout)
+        rule_set = _heading_rule_set(title, numbered_fields, rule_sets, metrics)
+        lap("classify")
+        if rule_set is None:
+            return title, []
+
+        # Extract headings unless form document
+        levels = None
+        if table is not None:
+            levels = span_table.heading_levels(table, body_size, HEADING_THRESHOLDS).tolist()
+        rejected = metrics["rejected"] if metrics is not None else None
+        counters = metrics["counters"] if metrics is not None else None
+        headings = _extract_headings(layout, body_size, title, levels, rejected, counters, rule_set)
+        lap("headings")
+        if metrics is not None:
+            metrics["path"] = "full"
+            metrics["counters"]["headings"] = len(headings)
         return title, headings
 
     except Exception as e:
-        print(f"Error processing {os.path.basename(pdf_path)}: {str(e)}")
+        if metrics is not None:
+            metrics["path"] = "error"
+            metrics["error"] = str(e)
+        if info is not None:
+            info["error"] = str(e)
+        print(f"Error processing {_source_name(pdf_path)}: {str(e)}")
         return "", []
     finally:
+        if info is not None and budget.truncated:
+            info["truncated"] = budget.truncated
         if 'doc' in locals():
             doc.close()
 
-if __name__ == "__main__":
+
+def write_result(output_dir, filename, title, outline, source=None, truncated=None, error=None,
+                 title_source=None):
+    """Write one document's result as pretty-printed JSON next to its siblings.
+
+    ``source`` ("outline" or "heuristic"), ``title_source`` ("metadata" or
+    "heuristic", for outline results), a ``truncated`` record (see Budget)
+    and the ``error`` of a failed extraction are written only when given. The
+    file is written under a temporary name and renamed into place, so readers
+    never see partial JSON.
+    """
+    output_path = os.path.join(output_dir, f"{os.path.splitext(filename)[0]}.json")
+    result = {"title": title, "outline": outline}
+    if source:
+        result["source"] = source
+    if title_source:
+        result["title_source"] = title_source
+    if truncated:
+        result["truncated"] = True
+        result["last_page"] = truncated["last_page"]
+    if error:
+        result["error"] = error
+    atomic_write(output_path, json.dumps(result, indent=2, ensure_ascii=False), suffix=".json.tmp")
+    return output_path
+
+
+def describe_info(info):
+    """Short status-line suffix for the diagnostic details worth showing"""
+    truncated = (info or {}).get("truncated")
+    if truncated:
+        return (f" (truncated by {truncated['reason']} after {truncated['last_page'] + 1}/"
+                f"{truncated['page_count']} pages)")
+    if (info or {}).get("source") == "outline":
+        return " (embedded outline)"
+    comparison = (info or {}).get("outline_comparison")
+    if comparison and comparison["embedded_usable"]:
+        return (f" (embedded outline agrees on {comparison['matched']}/{comparison['embedded_entries']} "
+                f"entries, {comparison['heuristic_entries']} found)")
+    body = (info or {}).get("body_size")
+    if not body or (body["method"] == "full" and not body["sample_pages"]):
+        return f" ({info['shards']} page shards)" if info and info.get("shards") else ""
+    if body["method"] == "sampled":
+        return f" (body size sampled from {body['pages_read']}/{body['page_count']} pages)"
+    return f" (body size sample ambiguous after {body['sample_pages']} pages, full scan)"
+
+
+def print_status(message, fallback):
+    """Print a status line, falling back to plain text on consoles without emoji"""
+    try:
+        print(message)
+    except UnicodeEncodeError:
+        print(fallback)
+
+
+def parse_args(argv=None):
+    """Command line options for the batch processor"""
+    parser = argparse.ArgumentParser(description="Extract titles and headings from PDF files")
+    parser.add_argument("--input-dir", help="Directory containing PDF files (default: /app/input or ./Input)")
+    parser.add_argument("--output-dir", help="Directory for JSON results (default: /app/output or ./Output)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; 0 uses every CPU, 1 processes files in-line (default: 1)")
+    parser.add_argument("--timeout", type=float, default=0,
+                        help="Per-document wall-clock limit in seconds; documents then always run in worker "
+                             "processes (default: none)")
+    parser.add_argument("--max-tasks-per-worker", type=int, default=50,
+                        help="Recycle a worker process after this many documents, 0 to never recycle (default: 50)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Split each long PDF's pages across this many processes (default: 1)")
+    parser.add_argument("--deadline", type=float, default=0,
+                        help="Stop parsing a document after this many seconds and keep the partial outline "
+                             "(default: none)")
+    parser.add_argument("--max-pages", type=int, default=0,
+                        help="Parse at most this many pages per document (default: all)")
+    parser.add_argument("--outline-mode", choices=OUTLINE_MODES, default="heuristic",
+                        help="Use the PDF's own bookmarks when they pass quality checks (prefer-outline), or "
+                             "report how they compare with the heuristic result (compare) (default: heuristic)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Hold spans in NumPy arrays and compute font statistics in bulk (requires numpy)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Process one page at a time to keep memory flat on very long PDFs")
+    parser.add_argument("--sample-body-size", action="store_true",
+                        help="With --streaming, estimate the body font size from a sample of pages")
+    parser.add_argument("--sample-confidence", type=float, default=0.95,
+                        help="Confidence required before trusting the sampled body size (default: 0.95)")
+    parser.add_argument("--output-format", choices=("json", "jsonl"), default="json",
+                        help="One pretty-printed JSON file per PDF (json), or compact records appended to "
+                             "results.jsonl in the output directory (jsonl) (default: json)")
+    parser.add_argument("--jsonl-shard-records", type=int, default=0,
+                        help="With --output-format jsonl, rotate to a new shard file after this many records "
+                             "(default: one file)")
+    parser.add_argument("--jsonl-shard-mb", type=float, default=0,
+                        help="With --output-format jsonl, rotate to a new shard file after this many MB "
+                             "(default: one file)")
+    parser.add_argument("--metrics-json", metavar="PATH",
+                        help="Record per-stage timings and filter counters and write them here as JSON")
+    parser.add_argument("--prometheus", metavar="PATH",
+                        help="Write batch metrics in Prometheus textfile format to this path")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record tracemalloc and RSS peaks per stage and per document (several times slower)")
+    parser.add_argument("--max-memory-mb", type=float, default=0,
+                        help="Fail a document whose worker process exceeds this resident memory; documents then "
+                             "always run in worker processes (default: none)")
+    parser.add_argument("--memory-report", type=int, default=10, metavar="N",
+                        help="With --trace-memory or --max-memory-mb, list the N documents with the highest peak "
+                             "memory (default: 10)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and extract PDFs as they are added to or changed in the input directory")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Extract only PDFs that are new or changed since the previous --watch or "
+                             "--incremental run, then exit")
+    parser.add_argument("--manifest", metavar="PATH",
+                        help="State file of PDFs already handled (default: .pdf-manifest.json in the output "
+                             "directory)")
+    parser.add_argument("--watch-interval", type=float, default=1.0,
+                        help="Seconds between scans of the input directory with --watch (default: 1)")
+    parser.add_argument("--settle-seconds", type=float, default=2.0,
+                        help="Leave PDFs modified more recently than this for a later scan, as they may still "
+                             "be being written (default: 2)")
+    parser.add_argument("--cache-dir", default=os.environ.get("PDF_CACHE_DIR"),
+                        help="Reuse results for unchanged PDFs from this directory (default: $PDF_CACHE_DIR)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the result cache entirely")
+    parser.add_argument("--rebuild-cache", action="store_true",
+                        help="Ignore cached results and overwrite them with fresh ones")
+    parser.add_argument("--cache-max-mb", type=float, default=512, help="Evict cache entries beyond this size (default: 512)")
+    parser.add_argument("--cache-max-age-days", type=float, default=30,
+                        help="Evict cache entries unused for this many days (default: 30)")
+    parser.add_argument("--page-cache-dir", default=os.environ.get("PDF_PAGE_CACHE_DIR"),
+                        help="Reuse the layout of pages seen in any earlier document from this directory "
+                             "(default: $PDF_PAGE_CACHE_DIR)")
+    parser.add_argument("--page-cache-max-mb", type=float, default=1024,
+                        help="Evict page cache entries beyond this size (default: 1024)")
+    args = parser.parse_args(argv)
+    if args.sample_body_size and not args.streaming:
+        parser.error("--sample-body-size requires --streaming")
+    if args.columnar and args.streaming:
+        parser.error("--columnar and --streaming cannot be combined")
+    if args.shards > 1 and (args.columnar or args.streaming):
+        parser.error("--shards cannot be combined with --columnar or --streaming")
+    if (args.deadline or args.max_pages) and (args.columnar or args.shards > 1):
+        parser.error("--deadline and --max-pages cannot be combined with --columnar or --shards")
+    if args.shards > 1 and args.workers != 1:
+        parser.error("--shards splits one document at a time and cannot be combined with --workers")
+    if args.shards > 1 and args.max_memory_mb:
+        parser.error("--max-memory-mb runs documents in worker processes and cannot be combined with --shards")
+    if args.shards > 1 and args.timeout:
+        parser.error("--timeout runs documents in worker processes and cannot be combined with --shards")
+    if (args.jsonl_shard_records or args.jsonl_shard_mb) and args.output_format != "jsonl":
+        parser.error("--jsonl-shard-records and --jsonl-shard-mb require --output-format jsonl")
+    if args.page_cache_dir and (args.columnar or args.shards > 1):
+        parser.error("--page-cache-dir cannot be combined with --columnar or --shards")
+    if args.watch and args.incremental:
+        parser.error("--watch and --incremental cannot be combined")
+    return args
+
+
+def extract_options_for(args):
+    """extract_title_headings keywords for the parsed command line"""
+    extract_options = {}
+    if args.columnar:
+        extract_options["columnar"] = True
+    if args.streaming:
+        extract_options["streaming"] = True
+    if args.shards > 1:
+        extract_options["shards"] = args.shards
+    if args.outline_mode != "heuristic":
+        extract_options["outline_mode"] = args.outline_mode
+    if args.deadline:
+        extract_options["deadline"] = args.deadline
+    if args.max_pages:
+        extract_options["max_pages"] = args.max_pages
+    if args.sample_body_size:
+        extract_options["sample_body_size"] = True
+        extract_options["sample_confidence"] = args.sample_confidence
+    if args.page_cache_dir:
+        # Passed as a directory so worker processes open their own PageCache
+        extract_options["page_cache"] = args.page_cache_dir
+    if args.trace_memory:
+        extract_options["trace_memory"] = True
+    if args.metrics_json or args.prometheus:
+        extract_options["instrument"] = True
+    return extract_options
+
+
+class BatchRunner:
+    """The command line's pipeline: result cache lookup, batch extraction and the output sink.
+
+    ``process`` may be called repeatedly (see watch); ``close`` flushes the
+    sink, writes the metrics and prints the cache totals.
+    """
+
+    def __init__(self, args, output_dir):
+        import batch
+        from sinks import FileSink, JsonLinesSink
+
+        self.batch = batch
+        self.args = args
+        self.output_dir = output_dir
+        self.extract_options = extract_options_for(args)
+        self.workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+        self.page_stats = {"hits": 0, "misses": 0} if args.page_cache_dir else None
+
+        self.aggregator = None
+        if args.metrics_json or args.prometheus:
+            from instrumentation import MetricsAggregator
+            self.aggregator = MetricsAggregator()
+
+        if args.output_format == "jsonl":
+            self.sink = JsonLinesSink(output_dir, shard_records=args.jsonl_shard_records,
+                                      shard_bytes=int(args.jsonl_shard_mb * 1024 * 1024))
+        else:
+            self.sink = FileSink(output_dir)
+
+        self.result_cache = None
+        if args.cache_dir and not args.no_cache:
+            from cache import ResultCache
+            # Options that change the result get their own entries; sampled body sizes are approximate
+            variant = [] if args.outline_mode == "heuristic" else [args.outline_mode]
+            if args.sample_body_size:
+                variant.append(f"sampled{args.sample_confidence:g}")
+            self.result_cache = ResultCache(args.cache_dir, max_bytes=int(args.cache_max_mb * 1024 * 1024),
+                                            max_age=args.cache_max_age_days * 24 * 3600,
+                                            rebuild=args.rebuild_cache, variant="+".join(variant))
+
+    def process(self, pdf_paths, digests=None, on_result=None):
+        """Extract ``pdf_paths`` and write their results, flushing the sink at the end.
+
+        ``digests`` supplies known SHA-256 digests by path. ``on_result`` is
+        called as ``on_result(pdf_path, status, info)`` for every document,
+        including cache hits.
+        """
+        args = self.args
+        digests = dict(digests or {})
+        if self.result_cache is not None:
+            from cache import file_digest
+            misses = []
+            for pdf_path in pdf_paths:
+                filename = os.path.basename(pdf_path)
+                try:
+                    if pdf_path not in digests:
+                        digests[pdf_path] = file_digest(pdf_path)
+                except OSError:
+                    misses.append(pdf_path)
+                    continue
+                cached = self.result_cache.get(digests[pdf_path])
+                if cached is None:
+                    misses.append(pdf_path)
+                    continue
+                title, outline, cached_info = cached
+                self.sink.write(self.batch.result_record(pdf_path, "cached", title, outline, info=cached_info,
+                                                         digest=digests[pdf_path]))
+                if self.aggregator is not None:
+                    self.aggregator.add(filename, status="cached")
+                print_status(f"✅ Processed: {filename} (cached)", f"[SUCCESS] Processed: {filename} (cached)")
+                if on_result is not None:
+                    on_result(pdf_path, "cached", cached_info)
+            pdf_paths = misses
+        if not pdf_paths:
+            self.flush()
+            return
+
+        def record(pdf_path, status, title, outline, elapsed, info):
+            # Empty results are not cached: they are also what a swallowed error looks like.
+            # Neither are partial ones, which a larger budget would complete.
+            if (status == "ok" and self.result_cache is not None and pdf_path in digests and (title or outline)
+                    and not info.get("truncated")):
+                self.result_cache.put(digests[pdf_path], title, outline, info)
+            if self.page_stats is not None:
+                for key, value in info.get("page_cache", {}).items():
+                    self.page_stats[key] += value
+            if self.aggregator is not None:
+                self.aggregator.add(os.path.basename(pdf_path), info.get("metrics"), elapsed, status)
+            if on_result is not None:
+                on_result(pdf_path, status, info)
+
+        summary = self.batch.run_batch(
+            pdf_paths, self.output_dir,
+            workers=self.workers, timeout=args.timeout,
+            max_tasks_per_worker=args.max_tasks_per_worker, on_result=record,
+            options=self.extract_options, sink=self.sink, digests=digests, max_memory_mb=args.max_memory_mb,
+            memory_report=args.memory_report if args.trace_memory or args.max_memory_mb else 0)
+        # Timeouts, memory kills and recycling only happen in worker processes
+        if self.workers > 1 or args.timeout or args.max_memory_mb:
+            self.batch.print_summary(summary)
+        if summary["memory_top"]:
+            from memory import print_report
+            print_report(summary["memory_top"])
+        self.flush()
+
+    def flush(self):
+        """Make the results written so far durable (see sinks)"""
+        self.sink.flush()
+
+    def close(self):
+        args = self.args
+        self.sink.close()
+
+        if self.aggregator is not None:
+            if args.metrics_json:
+                self.aggregator.write_json(args.metrics_json)
+            if args.prometheus:
+                self.aggregator.write_prometheus(args.prometheus)
+
+        if self.result_cache is not None:
+            self.result_cache.prune()
+            stats = self.result_cache.stats()
+            print(f"Cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['stores']} stored, {stats['evicted']} evicted")
+
+        if self.page_stats is not None:
+            from cache import PageCache
+            page_cache = PageCache(args.page_cache_dir, max_bytes=int(args.page_cache_max_mb * 1024 * 1024),
+                                   max_age=args.cache_max_age_days * 24 * 3600)
+            evicted = page_cache.prune()
+            print(f"Page cache: {self.page_stats['hits']} hits, {self.page_stats['misses']} misses, "
+                  f"{evicted} evicted")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
     # Docker-compatible paths as specified in challenge requirements
     input_dir = "/app/input"
     output_dir = "/app/output"
-    
+
     # Fallback to local directories if running outside Docker
     if not os.path.exists(input_dir):
         base_dir = os.path.dirname(os.path.abspath(__file__))
         input_dir = os.path.join(base_dir, "Input")
         output_dir = os.path.join(base_dir, "Output")
 
+    input_dir = args.input_dir or input_dir
+    output_dir = args.output_dir or output_dir
+
     for directory in [input_dir, output_dir]:
         if not os.path.exists(directory):
             os.makedirs(directory)
             print(f"Created directory: {directory}")
 
+    if args.watch or args.incremental:
+        import watch
+        runner = BatchRunner(args, output_dir)
+        try:
+            watch.watch_folder(input_dir, runner, args.manifest or os.path.join(output_dir, watch.MANIFEST_NAME),
+                               interval=args.watch_interval, settle=args.settle_seconds, once=args.incremental)
+        finally:
+            runner.close()
+        return 0
+
     pdf_files = [f for f in os.listdir(input_dir) if f.lower().endswith('.pdf')]
     if not pdf_files:
         print(f"No PDF files found in: {input_dir}")
         print("Please add PDF files and run again.")
-        exit(1)
+        return 1
 
-    for filename in pdf_files:
-        try:
-            pdf_path = os.path.join(input_dir, filename)
-            title, outline = extract_title_headings(pdf_path)
-            result = {"title": title, "outline": outline}
-            output_path = os.path.join(output_dir, f"{os.path.splitext(filename)[0]}.json")
-            with open(output_path, "w", encoding='utf-8') as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
-            try:
-                print(f"✅ Processed: {filename}")
-            except UnicodeEncodeError:
-                print(f"[SUCCESS] Processed: {filename}")
-        except Exception as e:
-            try:
-                print(f"❌ Error processing {filename}: {str(e)}")
-            except UnicodeEncodeError:
-                print(f"[ERROR] Error processing {filename}: {str(e)}")
-            error_output = os.path.join(output_dir, f"{os.path.splitext(filename)[0]}.json")
-            with open(error_output, "w", encoding='utf-8') as f:
-                json.dump({"title": "", "outline": []}, f, indent=2)
\ No newline at end of file
+    pdf_paths = [os.path.join(input_dir, f) for f in pdf_files]
+    runner = BatchRunner(args, output_dir)
+    try:
+        runner.process(pdf_paths)
+    finally:
+        runner.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
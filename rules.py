@@ -0,0 +1,184 @@
+"""Declarative rules for the title, document-type and heading heuristics.
+
+Heading rules are ``(name, predicate)`` pairs over a block's BlockFeatures,
+which computes the word split, case and size level once per block; regexes
+are compiled once at import. A rule set lists rejection rules and heading
+patterns. The heading pass picks
+the set for the document's type (see DOCUMENT_TYPES and DOCUMENT_RULE_SETS)
+and counts a hit for the rule that decided each block.
+"""
+import re
+
+HEADING_THRESHOLDS = [(1.35, "H1"), (1.05, "H2"), (1.0, "H3")]
+# Longer blocks are always rejected as "too_long"
+HEADING_MAX_CHARS = 100
+FORM_MIN_NUMBERED_FIELDS = 5
+
+_YEAR = re.compile(r'.\b\d{4}\b.')
+_NUMBERED = re.compile(r'^\d+\.\s+')
+_NUMBERED_SUBSECTION = re.compile(r'^\d+\.\d+\s+')
+_CAPITALIZED = re.compile(r'^[A-Z][a-z]')
+_COLON_END = re.compile(r':\s*$')
+
+
+class BlockFeatures:
+    """Facts about one non-empty block that several heading rules read, computed once"""
+
+    __slots__ = ("block", "text", "page_num", "page_width", "body_size", "title", "max_size", "bold",
+                 "words", "n_words", "n_chars", "is_upper", "short_caps", "size_level")
+
+    def __init__(self, block, clean_text, page_num, page_width, body_size, title, levels=None):
+        self.block = block
+        self.text = clean_text
+        self.page_num = page_num
+        self.page_width = page_width
+        self.body_size = body_size
+        self.title = title
+        self.max_size = max_size = block["max_size"]
+        self.bold = block["is_bold"]
+        self.words = words = clean_text.split()
+        self.n_words = len(words)
+        self.n_chars = len(clean_text)
+        self.is_upper = clean_text.isupper()
+        self.short_caps = self.is_upper and self.n_words <= 5
+        # Level number from font size alone, 0 below every threshold
+        if levels is not None:
+            self.size_level = levels[block["block_id"]]
+        else:
+            self.size_level = 0
+            for ratio, level in HEADING_THRESHOLDS:
+                if max_size >= body_size * ratio:
+                    self.size_level = int(level[1:])
+                    break
+
+    @property
+    def level(self):
+        """Final level number: short all-caps labels below every size threshold become H1"""
+        return self.size_level or 1
+
+    @property
+    def width(self):
+        x0, _, x1, _ = self.block["bbox"]
+        return x1 - x0
+
+
+# Every rejection rule rejects on its own, so their order only decides which
+# rule a block is counted under; cheap and selective checks come first.
+# wide_content must precede below_size_threshold, which covers all of its cases.
+HEADING_REJECT_RULES = (
+    ("too_long", lambda f: f.n_chars > HEADING_MAX_CHARS),
+    ("first_page_text", lambda f: f.page_num == 0 and f.n_words > 3 and f.n_chars < 50),
+    ("short_label", lambda f: f.n_chars <= 4 and f.text.endswith(':')),
+    ("too_many_words", lambda f: f.n_words > 25 and not f.is_upper),
+    ("wide_content", lambda f: not f.short_caps and not f.size_level and f.width > f.page_width * 0.85),
+    ("below_size_threshold", lambda f: not f.size_level and not f.short_caps),
+    ("part_of_title", lambda f: bool(f.title) and f.text in f.title.strip()),
+    ("repetitive", lambda f: f.n_words > 5 and len(set(f.words)) < f.n_words * 0.6),
+    ("contains_year", lambda f: _YEAR.match(f.text)),
+)
+
+# A block surviving the rejection rules is a heading if any pattern matches
+HEADING_PATTERNS = (
+    ("short_caps", lambda f: f.short_caps),
+    ("numbered", lambda f: _NUMBERED.match(f.text)),
+    ("numbered_subsection", lambda f: _NUMBERED_SUBSECTION.match(f.text)),
+    ("capitalized", lambda f: _CAPITALIZED.match(f.text)),
+    ("caps_phrase", lambda f: f.is_upper and f.n_words > 1),
+    ("bold_label", lambda f: f.bold and _COLON_END.search(f.text)),
+    ("bold_large", lambda f: f.bold and f.max_size >= f.body_size * 1.3),
+    ("large_short", lambda f: f.max_size >= f.body_size * 1.3 and f.n_words <= 15),
+    ("large_word", lambda f: f.n_words == 1 and f.max_size >= f.body_size * 1.25),
+)
+
+# "prefilter" marks rule sets that reject every block longer than
+# HEADING_MAX_CHARS and every block below the lowest size threshold that is not
+# a short all-caps label, which lets the heading pass skip such pages wholesale.
+DEFAULT_RULES = {"reject": HEADING_REJECT_RULES, "accept": HEADING_PATTERNS, "prefilter": True}
+
+RULE_SETS = {"default": DEFAULT_RULES}
+
+
+def evaluate(rules, features):
+    """Name of the first rule whose predicate holds for ``features``, or None"""
+    for name, predicate in rules:
+        if predicate(features):
+            return name
+    return None
+
+
+def classify_block(rule_set, features):
+    """Decide one block: ``(level, pattern, None)`` for a heading or ``(None, None, reason)``"""
+    reason = evaluate(rule_set["reject"], features)
+    if reason:
+        return None, None, reason
+    pattern = evaluate(rule_set["accept"], features)
+    if pattern is None:
+        return None, None, "no_heading_pattern"
+    return f"H{features.level}", pattern, None
+
+
+def has_form_title(title):
+    """Short, simple titles are typical of forms"""
+    title_lower = str(title).lower()
+    title_words = title_lower.split()
+
+    has_complex_structure = (len(title_words) >= 10 or ':' in title or any(len(word) > 12 for word in title_words))
+    title_char_length = len(title.replace(' ', ''))
+    avg_word_length = sum(len(word) for word in title_words) / len(title_words) if title_words else 0
+
+    return (len(title_words) <= 9 and
+            avg_word_length <= 5.5 and title_char_length <= 35 and
+            not has_complex_structure)
+
+
+# Document types, tested in order on the title and numbered-field count
+DOCUMENT_TYPES = (
+    ("form", lambda title, numbered_fields: (numbered_fields >= FORM_MIN_NUMBERED_FIELDS and
+                                            has_form_title(title))),
+)
+
+# Heading rule set per document type; None skips the heading pass
+DOCUMENT_RULE_SETS = {"form": None, "document": "default"}
+
+
+def classify_document(title, numbered_fields):
+    """First matching DOCUMENT_TYPES name, or "document\""""
+    for name, predicate in DOCUMENT_TYPES:
+        if predicate(title, numbered_fields):
+            return name
+    return "document"
+
+
+def rule_set_for(document_type, rule_sets=None):
+    """Name of the heading rule set for a document type, with per-call overrides"""
+    names = dict(DOCUMENT_RULE_SETS, **(rule_sets or {}))
+    return names.get(document_type, names["document"])
+
+
+def fix_rfp_acronym(text):
+    """Expand short acronym prefixes such as 'RFP:' in titles"""
+    if text.startswith('RFP:') and len(text.split()) >= 5:
+        colon_pos = text.find(':')
+        if colon_pos > 0 and colon_pos < 5:
+            after_colon = text[colon_pos+1:].strip()
+            if after_colon and after_colon[0] != after_colon[0].lower():
+                first_word = after_colon.split()[0] if after_colon.split() else ""
+                if len(first_word) <= 3:
+                    acronym = text[:colon_pos]
+                    text = text.replace(f'{acronym}:', f'{acronym}:Expanded Form ', 1)
+    return text
+
+
+TITLE_FIXES = (
+    ("rfp_acronym", fix_rfp_acronym),
+)
+
+
+def apply_title_fixes(text, counters=None):
+    """Run every TITLE_FIXES entry over a title, counting the ones that changed it"""
+    for name, fix in TITLE_FIXES:
+        fixed = fix(text)
+        if counters is not None and fixed != text:
+            counters[f"title_fix_{name}"] += 1
+        text = fixed
+    return text
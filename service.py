@@ -0,0 +1,322 @@
+"""Long-running extraction service speaking newline-delimited JSON.
+
+Each request is one JSON object per line::
+
+    {"id": "42", "path": "/data/report.pdf"}
+    {"id": "43", "data": "<base64 PDF bytes>", "options": {"streaming": true}}
+    {"op": "ping"}
+    {"op": "shutdown"}
+
+and each reply is one JSON object per line carrying the same ``id``::
+
+    {"id": "42", "status": "ok", "title": "...", "outline": [...], "info": {...}, "elapsed": 0.05}
+    {"id": "43", "status": "error", "error": "..."}
+
+Replies are written as requests complete, so they may arrive out of order.
+Requests are read from stdin (replies on stdout) or from clients of a local
+Unix socket, and run on a pool of pre-warmed worker processes.
+"""
+import argparse
+import base64
+import binascii
+import itertools
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def _warm_worker():
+    """Import PyMuPDF and the extractor up front, keeping stdout free for replies"""
+    sys.stdout = sys.stderr
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import fitz
+    import process_pdf  # noqa: F401
+    fitz.open().close()
+
+
+def _noop():
+    return os.getpid()
+
+
+def _handle(request_id, source, options):
+    """Run one extraction inside a worker process and build its reply"""
+    from process_pdf import extract_title_headings
+
+    started = time.perf_counter()
+    info = {}
+    try:
+        title, outline = extract_title_headings(source, info=info, **options)
+    except Exception as e:
+        return {"id": request_id, "status": "error", "error": str(e)}
+    if info.get("error"):
+        return {"id": request_id, "status": "error", "error": info["error"], "info": info,
+                "elapsed": round(time.perf_counter() - started, 6)}
+    return {"id": request_id, "status": "ok", "title": title, "outline": outline,
+            "info": info, "elapsed": round(time.perf_counter() - started, 6)}
+
+
+class ExtractionService:
+    """Shared worker pool plus the admission limit for in-flight requests"""
+
+    def __init__(self, workers=None, max_inflight=None, max_tasks_per_worker=0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_inflight = max_inflight or self.workers * 2
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.pool = self._new_pool()
+        self._pool_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.max_inflight)
+        self.stopping = threading.Event()
+        self._ids = itertools.count(1)
+        self._inflight = 0
+        self._idle = threading.Condition()
+
+    def _new_pool(self):
+        pool_kwargs = {}
+        if self.max_tasks_per_worker:
+            pool_kwargs["max_tasks_per_child"] = self.max_tasks_per_worker
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker, **pool_kwargs)
+
+    def _submit(self, *args):
+        """Submit to the pool, replacing it once if a crashed worker broke it"""
+        with self._pool_lock:
+            try:
+                return self.pool.submit(*args)
+            except BrokenProcessPool:
+                self.pool.shutdown(wait=False)
+                self.pool = self._new_pool()
+                return self.pool.submit(*args)
+
+    def warm_up(self):
+        """Start every worker now instead of on the first requests"""
+        futures = [self.pool.submit(_noop) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def submit_line(self, line, reply):
+        """Parse one request line and schedule it.
+
+        ``reply`` is called with the response dict, possibly from another thread.
+        Returns an Event that is set once the reply has been written.
+        """
+        replied = threading.Event()
+
+        def reply_once(response):
+            try:
+                reply(response)
+            finally:
+                replied.set()
+
+        line = line.strip()
+        if not line:
+            replied.set()
+            return replied
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            reply_once({"id": None, "status": "error", "error": f"invalid request: {e}"})
+            return replied
+
+        request_id = request.get("id")
+        if request_id is None:
+            request_id = str(next(self._ids))
+
+        op = request.get("op", "extract")
+        if op == "ping":
+            reply_once({"id": request_id, "status": "ok", "workers": self.workers, "inflight": self._inflight})
+            return replied
+        if op == "shutdown":
+            reply_once({"id": request_id, "status": "ok"})
+            self.stopping.set()
+            return replied
+        if op != "extract":
+            reply_once({"id": request_id, "status": "error", "error": f"unknown op: {op}"})
+            return replied
+
+        try:
+            if "data" in request:
+                source = base64.b64decode(request["data"], validate=True)
+            elif "path" in request:
+                source = request["path"]
+            else:
+                raise ValueError("request needs 'path' or 'data'")
+            options = request.get("options") or {}
+            if not isinstance(options, dict):
+                raise ValueError("'options' must be an object")
+        except (ValueError, binascii.Error) as e:
+            reply_once({"id": request_id, "status": "error", "error": str(e)})
+            return replied
+
+        # Blocks the reader when max_inflight requests are already running
+        self.slots.acquire()
+        with self._idle:
+            self._inflight += 1
+        try:
+            future = self._submit(_handle, request_id, source, options)
+        except RuntimeError as e:
+            self._release()
+            reply_once({"id": request_id, "status": "error", "error": str(e)})
+            return replied
+
+        def done(future):
+            try:
+                response = future.result()
+            except Exception as e:
+                response = {"id": request_id, "status": "error", "error": f"worker failed: {e}"}
+            try:
+                reply_once(response)
+            finally:
+                self._release()
+
+        future.add_done_callback(done)
+        return replied
+
+    def _release(self):
+        self.slots.release()
+        with self._idle:
+            self._inflight -= 1
+            if not self._inflight:
+                self._idle.notify_all()
+
+    def drain(self):
+        """Wait for every in-flight request to reply"""
+        with self._idle:
+            while self._inflight:
+                self._idle.wait()
+
+    def close(self):
+        self.drain()
+        self.pool.shutdown(wait=True)
+
+
+def _line_writer(stream):
+    """Thread-safe writer of one compact JSON object per line"""
+    lock = threading.Lock()
+
+    def reply(response):
+        line = json.dumps(response, ensure_ascii=False) + "\n"
+        with lock:
+            stream.write(line)
+            stream.flush()
+
+    return reply
+
+
+class _Shutdown(Exception):
+    """Raised from a signal handler to stop reading new requests"""
+
+
+def _raise_shutdown(signum, frame):
+    raise _Shutdown()
+
+
+def serve_stdio(service, infile=None, outfile=None):
+    """Serve requests from stdin until EOF, a shutdown request, SIGTERM or SIGINT.
+
+    Requests already accepted are always allowed to finish and reply.
+    """
+    infile = infile or sys.stdin
+    reply = _line_writer(outfile or sys.stdout)
+    try:
+        for line in infile:
+            service.submit_line(line, reply)
+            if service.stopping.is_set():
+                break
+    except (_Shutdown, KeyboardInterrupt):
+        service.stopping.set()
+    finally:
+        service.close()
+
+
+def serve_socket(service, socket_path):
+    """Serve requests from clients of a local Unix socket, one JSON-lines stream each"""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            reply = _line_writer(_SocketText(self.wfile))
+            replies = []
+            for raw in self.rfile:
+                if service.stopping.is_set():
+                    break
+                replies.append(service.submit_line(raw.decode("utf-8", "replace"), _ignore_disconnect(reply)))
+                if service.stopping.is_set():
+                    threading.Thread(target=server.shutdown, daemon=True).start()
+                    break
+            # Keep the connection open until this client's replies are written
+            for replied in replies:
+                replied.wait()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+
+    def stop(signum, frame):
+        service.stopping.set()
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def _ignore_disconnect(reply):
+    """Drop replies for clients that have already gone away"""
+    def safe_reply(response):
+        try:
+            reply(response)
+        except OSError:
+            pass
+    return safe_reply
+
+
+class _SocketText:
+    """Text adapter over a socket's binary write file"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode("utf-8"))
+
+    def flush(self):
+        self.wfile.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve PDF title/heading extraction over JSON lines")
+    parser.add_argument("--socket", help="Listen on this Unix socket path instead of stdin/stdout")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--max-inflight", type=int, default=0,
+                        help="Maximum requests running or queued at once (default: 2 x workers)")
+    parser.add_argument("--max-tasks-per-worker", type=int, default=0,
+                        help="Recycle a worker after this many documents (default: never)")
+    args = parser.parse_args(argv)
+
+    service = ExtractionService(args.workers, args.max_inflight, args.max_tasks_per_worker)
+    service.warm_up()
+    print(f"Service ready with {service.workers} workers", file=sys.stderr)
+
+    if args.socket:
+        serve_socket(service, args.socket)
+    else:
+        signal.signal(signal.SIGTERM, _raise_shutdown)
+        serve_stdio(service)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,123 @@
+"""Output sinks for batch results.
+
+A record is a dict with the source ``file`` name and ``path``, its ``sha256``
+(filled in by JsonLinesSink when missing), ``status`` ("ok", "cached",
+"error", "timeout", "memory" or "crashed"), ``title``, ``outline``,
+``error``, ``elapsed`` seconds and optional ``stages`` timings, ``memory``
+figures in bytes (see memory.MemoryTrace; only ``rss_peak`` for a document
+killed over its memory ceiling), ``source``, ``title_source`` and
+``truncated``. Sinks have ``write(record)``, ``flush()`` and ``close()`` and
+work as context managers.
+"""
+import json
+import os
+import time
+
+from process_pdf import write_result
+
+JSONL_BUFFER_BYTES = 1 << 20
+
+
+class FileSink:
+    """One pretty-printed JSON file per document, written atomically (see process_pdf.write_result)"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def write(self, record):
+        write_result(self.output_dir, record["file"], record["title"], record["outline"], record.get("source"),
+                     record.get("truncated"), record.get("error"), record.get("title_source"))
+
+    def flush(self):
+        """Make every record written so far durable; per-document files already are"""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonLinesSink(FileSink):
+    """Compact records appended to ``<prefix>.jsonl`` through a buffered writer.
+
+    With ``shard_records`` or ``shard_bytes`` set, records go to numbered
+    shards ``<prefix>-<run>-<n>.jsonl`` instead. Each shard is written as a
+    ``.part`` file and renamed once complete, so consumers never read a shard
+    that is still growing.
+    """
+
+    def __init__(self, output_dir, prefix="results", shard_records=0, shard_bytes=0,
+                 buffer_bytes=JSONL_BUFFER_BYTES):
+        super().__init__(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        self.prefix = prefix
+        self.shard_records = shard_records
+        self.shard_bytes = shard_bytes
+        self.buffer_bytes = buffer_bytes
+        self.sharded = bool(shard_records or shard_bytes)
+        self.run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        self.shards = 0
+        self.paths = []
+        self._file = None
+        self._part_path = None
+        self._records = 0
+        self._bytes = 0
+
+    def _open(self):
+        if not self.sharded:
+            path = os.path.join(self.output_dir, f"{self.prefix}.jsonl")
+            self._file = open(path, "a", encoding="utf-8", buffering=self.buffer_bytes)
+            self.paths.append(path)
+            return
+        self._part_path = os.path.join(self.output_dir,
+                                       f"{self.prefix}-{self.run_id}-{self.shards:05d}.jsonl.part")
+        self._file = open(self._part_path, "w", encoding="utf-8", buffering=self.buffer_bytes)
+        self.shards += 1
+        self._records = 0
+        self._bytes = 0
+
+    def _finish_shard(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        if self._part_path is not None:
+            path = self._part_path[:-len(".part")]
+            os.replace(self._part_path, path)
+            self.paths.append(path)
+            self._part_path = None
+
+    def write(self, record):
+        if record.get("sha256") is None and record.get("path"):
+            from cache import file_digest
+            try:
+                record["sha256"] = file_digest(record["path"])
+            except OSError:
+                pass
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        if self._file is None:
+            self._open()
+        self._file.write(line)
+        self._records += 1
+        self._bytes += len(line.encode("utf-8"))
+        if self.sharded and ((self.shard_records and self._records >= self.shard_records) or
+                             (self.shard_bytes and self._bytes >= self.shard_bytes)):
+            self._finish_shard()
+
+    def flush(self):
+        """Flush and fsync the buffered records; a shard in progress is finished and renamed"""
+        if self._file is None:
+            return
+        if self.sharded:
+            self._finish_shard()
+        else:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._finish_shard()
@@ -0,0 +1,130 @@
+"""Columnar span storage and vectorized font statistics (requires NumPy)"""
+from array import array
+
+import numpy as np
+
+
+def build_span_table(doc):
+    """Parse every page once into block-level layout plus parallel span arrays.
+
+    Spans of every page except the first are kept only as columns: size, char
+    count, page, bbox, bold flag and global block id. The first page keeps its
+    full lines/spans for the poster check and title search. Block ``max_size``
+    and ``is_bold`` are filled in bulk from the span columns.
+    """
+    from process_pdf import _page_layout, _page_summary, text_blocks
+
+    sizes = array("d")
+    chars = array("l")
+    pages = array("l")
+    bboxes = array("f")
+    bold = array("b")
+    block_ids = array("l")
+
+    layout = []
+    blocks = []
+    for page_num in range(len(doc)):
+        page = doc[page_num]
+        if page_num == 0:
+            page_layout = _page_layout(page, page_num)
+            for block in page_layout["blocks"]:
+                block_id = len(blocks)
+                block["block_id"] = block_id
+                blocks.append(block)
+                for line in block["lines"]:
+                    for span in line["spans"]:
+                        sizes.append(span["size"])
+                        chars.append(len(span["text"]))
+                        pages.append(page_num)
+                        bboxes.extend(span["bbox"])
+                        bold.append(span["bold"])
+                        block_ids.append(block_id)
+            layout.append(page_layout)
+            continue
+
+        page_blocks = []
+        for block in text_blocks(page):
+            block_id = len(blocks)
+            block_text = ""
+            for line in block.get("lines", []):
+                for span in line.get("spans", []):
+                    text = span.get("text", "")
+                    block_text += text
+                    sizes.append(span.get("size", 0))
+                    chars.append(len(text))
+                    pages.append(page_num)
+                    bboxes.extend(span.get("bbox", (0, 0, 0, 0)))
+                    bold.append("bold" in span.get("font", "").lower())
+                    block_ids.append(block_id)
+            entry = {
+                "bbox": tuple(block.get("bbox", (0, 0, 0, 0))),
+                "lines": [],
+                "text": block_text,
+                "max_size": 0,
+                "is_bold": False,
+                "block_id": block_id,
+            }
+            blocks.append(entry)
+            page_blocks.append(entry)
+        layout.append({
+            "page_num": page_num,
+            "width": page.rect.width,
+            "height": page.rect.height,
+            "blocks": page_blocks,
+        })
+
+    table = {
+        "size": np.frombuffer(sizes, dtype=np.float64) if sizes else np.zeros(0),
+        "chars": np.asarray(chars, dtype=np.int64),
+        "page": np.asarray(pages, dtype=np.int32),
+        "bbox": np.asarray(bboxes, dtype=np.float32).reshape(-1, 4),
+        "bold": np.asarray(bold, dtype=np.bool_),
+        "block": np.asarray(block_ids, dtype=np.int32),
+        "n_blocks": len(blocks),
+    }
+
+    block_max, block_bold = block_aggregates(table)
+    for block, max_size, is_bold in zip(blocks, block_max.tolist(), block_bold.tolist()):
+        block["max_size"] = max_size
+        block["is_bold"] = is_bold
+    table["block_max"] = block_max
+    for page_layout in layout:
+        page_layout["summary"] = _page_summary(page_layout["blocks"])
+    return layout, table
+
+
+def block_aggregates(table):
+    """Per-block max span size (floored at 0) and any-bold flag"""
+    block_max = np.zeros(table["n_blocks"], dtype=np.float64)
+    block_bold = np.zeros(table["n_blocks"], dtype=np.bool_)
+    np.maximum.at(block_max, table["block"], table["size"])
+    np.logical_or.at(block_bold, table["block"], table["bold"])
+    return block_max, block_bold
+
+
+def body_size(table):
+    """Most common rounded font size weighted by characters, or None without spans.
+
+    Ties go to the size seen first in the document, matching the dict-based
+    histogram. Rounding is done on unique sizes with Python's round() so the
+    buckets are identical to the span-by-span path.
+    """
+    if not len(table["size"]):
+        return None
+    unique_sizes, first_index, inverse = np.unique(table["size"], return_index=True, return_inverse=True)
+    rounded = np.array([round(size, 1) for size in unique_sizes.tolist()])
+    buckets, bucket_of_unique = np.unique(rounded, return_inverse=True)
+    bucket_of_span = bucket_of_unique[inverse]
+    counts = np.bincount(bucket_of_span, weights=table["chars"], minlength=len(buckets))
+    first_seen = np.full(len(buckets), len(table["size"]), dtype=np.int64)
+    np.minimum.at(first_seen, bucket_of_unique, first_index)
+    best = np.lexsort((first_seen, -counts))[0]
+    return float(buckets[best])
+
+
+def heading_levels(table, body_size, thresholds):
+    """Heading level number per block (1 = H1 ... 0 = below every threshold)"""
+    block_max = table["block_max"]
+    conditions = [block_max >= body_size * ratio for ratio, _ in thresholds]
+    choices = [int(level[1:]) for _, level in thresholds]
+    return np.select(conditions, choices, default=0)
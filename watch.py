@@ -0,0 +1,207 @@
+"""Incremental processing of an input folder, once or continuously.
+
+A manifest in the output directory records every PDF already handled: its
+size, modification time, SHA-256 and output status. Each scan lists the
+folder with one stat per file. Only files whose size or mtime differ from the
+manifest are hashed, and only those whose content changed too are extracted,
+so unchanged or merely touched files are never reprocessed. A PDF still being
+written is left for a later scan: it must be ``settle`` seconds old, unchanged
+since the previous scan while watching, and end with the ``%%EOF`` marker
+(waived after INCOMPLETE_WAIT_SECONDS, so broken files still get reported).
+
+Files with no manifest entry whose JSON result is newer than the PDF, such as
+the output of an earlier plain run, are adopted into the manifest instead of
+being extracted again.
+"""
+import json
+import os
+import signal
+import threading
+import time
+
+from atomic import atomic_write
+from cache import file_digest
+
+MANIFEST_NAME = ".pdf-manifest.json"
+MANIFEST_VERSION = 1
+# Progress is saved at least this often during a long batch
+MANIFEST_SAVE_SECONDS = 5.0
+INCOMPLETE_WAIT_SECONDS = 60.0
+# Writers may append whitespace or a few bytes of junk after the final %%EOF
+_EOF_WINDOW = 1024
+
+
+def load_manifest(path):
+    """Manifest entries by file name; empty if the manifest is missing, unreadable or outdated"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("files", {})
+
+
+def save_manifest(path, files):
+    """Write the manifest via a temporary file and rename"""
+    atomic_write(path, json.dumps({"version": MANIFEST_VERSION, "files": files}, ensure_ascii=False),
+                 prefix=".manifest-")
+
+
+def scan(input_dir):
+    """``(size, mtime_ns)`` of every PDF in ``input_dir`` by file name"""
+    found = {}
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(".pdf"):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                # Removed between listing and stat
+                continue
+            found[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return found
+
+
+def _has_eof_marker(path):
+    """Whether the file ends like a complete PDF"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - _EOF_WINDOW))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+def _adopt(output_dir, name, size, mtime_ns, digest):
+    """Manifest entry for an existing JSON result at least as new as the PDF, or None"""
+    output_path = os.path.join(output_dir, f"{os.path.splitext(name)[0]}.json")
+    try:
+        if os.stat(output_path).st_mtime_ns < mtime_ns:
+            return None
+        with open(output_path, encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return {"size": size, "mtime_ns": mtime_ns, "sha256": digest,
+            "status": "error" if result.get("error") else "adopted", "processed_at": time.time()}
+
+
+class FolderState:
+    """The manifest of one input folder and the scans that decide what to extract"""
+
+    def __init__(self, input_dir, output_dir, manifest_path, settle=2.0, adopt=True):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.manifest_path = manifest_path
+        self.settle = settle
+        self.adopt = adopt
+        self.files = load_manifest(manifest_path)
+        self.found = {}
+        self.previous = None
+        self.dirty = False
+        self.saved = time.monotonic()
+
+    def due(self):
+        """Scan the folder; return the paths to extract and their SHA-256 digests by path"""
+        self.found = found = scan(self.input_dir)
+        for name in [name for name in self.files if name not in found]:
+            del self.files[name]
+            self.dirty = True
+
+        now = time.time_ns()
+        paths = []
+        digests = {}
+        for name, (size, mtime_ns) in sorted(found.items()):
+            entry = self.files.get(name)
+            if entry is not None and entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+                continue
+            # Still being written: empty, too recent, or changed since the previous scan
+            if size == 0 or now - mtime_ns < self.settle * 1e9:
+                continue
+            if self.previous is not None and self.previous.get(name) != (size, mtime_ns):
+                continue
+            path = os.path.join(self.input_dir, name)
+            if now - mtime_ns < INCOMPLETE_WAIT_SECONDS * 1e9 and not _has_eof_marker(path):
+                continue
+            try:
+                digest = file_digest(path)
+            except OSError:
+                continue
+            if entry is not None and entry.get("sha256") == digest:
+                entry["size"], entry["mtime_ns"] = size, mtime_ns
+                self.dirty = True
+                continue
+            if entry is None and self.adopt:
+                adopted = _adopt(self.output_dir, name, size, mtime_ns, digest)
+                if adopted is not None:
+                    self.files[name] = adopted
+                    self.dirty = True
+                    continue
+            paths.append(path)
+            digests[path] = digest
+        self.previous = found
+        return paths, digests
+
+    def record(self, pdf_path, status, digest):
+        """Record one extracted document; the caller saves the manifest once its output is durable"""
+        name = os.path.basename(pdf_path)
+        size, mtime_ns = self.found[name]
+        self.files[name] = {"size": size, "mtime_ns": mtime_ns, "sha256": digest, "status": status,
+                            "processed_at": time.time()}
+        self.dirty = True
+
+    @property
+    def save_due(self):
+        return self.dirty and time.monotonic() - self.saved >= MANIFEST_SAVE_SECONDS
+
+    def save(self):
+        if self.dirty:
+            save_manifest(self.manifest_path, self.files)
+            self.dirty = False
+        self.saved = time.monotonic()
+
+
+def watch_folder(input_dir, runner, manifest_path, interval=1.0, settle=2.0, once=False):
+    """Extract new and changed PDFs in ``input_dir`` with ``runner`` (a process_pdf.BatchRunner).
+
+    With ``once`` set the folder is scanned a single time, which suits cron;
+    otherwise it is polled every ``interval`` seconds until SIGINT or SIGTERM.
+    SIGTERM lets the current batch finish first. Failed documents are not
+    retried until the file changes.
+    """
+    state = FolderState(input_dir, runner.output_dir, manifest_path, settle,
+                        adopt=runner.args.output_format == "json")
+    stopping = threading.Event()
+    if not once:
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+        print(f"Watching {input_dir} for new or changed PDFs (every {interval:g}s)")
+
+    def on_result(pdf_path, status, info):
+        state.record(pdf_path, status, digests.get(pdf_path))
+        if state.save_due:
+            # The manifest must never list a document whose output is still buffered
+            runner.flush()
+            state.save()
+
+    try:
+        while True:
+            paths, digests = state.due()
+            if paths:
+                runner.process(paths, digests, on_result)
+            state.save()
+            if once:
+                if not paths:
+                    print(f"No new or changed PDFs in: {input_dir}")
+                break
+            if stopping.wait(interval):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state.save()